@@ -1,26 +1,39 @@
 # Standard library imports
 import os
+import sys
 import csv
-import threading
-import time
-from datetime import datetime
+import sqlite3
+import atexit
+import subprocess
+from datetime import datetime, timezone
 
 # Third-party imports
 import numpy as np
 from flask import (
-    Flask, render_template, request, redirect, url_for, session,
+    Flask, Response, render_template, request, redirect, url_for, session,
     jsonify, flash
 )
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
 
 # Local application imports
 from config import Config
 from db.dbo import (
-    Product, Tracking, User, Category, ProductCategory,
+    Product, Tracking, User,
     UserActivityLog, db
 )
-from search_engine import ImageSearch, TextSearch
-from recommendation_system import DeepContentBasedFiltering, DeepQNetwork
+from db.activity_store import ActivityStore
+from db.activity_writer import ActivityWriter
+from db.category_cache import CategoryCache
+from db.favourites_cache import FavouritesCache
+from db.leaderboard import TopRatedLeaderboard
+from db.recommendation_cache import RecommendationCache
+from engines import EngineRegistry
+from search_engine import TextIndexUpdater, TextSearch
+from search_engine.query_cache import create_query_cache
+from recommendation_system.dqn_inference import snapshot_pointer_for
+from tracing import Tracer
 
 # Create Flask application
 app = Flask(__name__)
@@ -29,10 +42,20 @@ app.config.from_object(Config)
 # Initialize SQLAlchemy
 db.init_app(app)
 
+# Request tracing: timed stage spans, per-route latency and DB query histograms served at /metrics;
+# requests slower than SLOW_REQUEST_MS are printed with their span breakdown
+tracer = Tracer(
+    enabled=app.config.get('TRACING', True),
+    slow_request_ms=app.config.get('SLOW_REQUEST_MS')
+)
+tracer.init_app(app)
+
 # Constants from config
 MODEL_PATH = app.config['MODEL_PATH']
 CSV_FILE_PATH = app.config['CSV_FILE_PATH']
-MODEL_UPDATE_INTERVAL = app.config['MODEL_UPDATE_INTERVAL']
+ACTIVITY_STORE_PATH = app.config.get(
+    'ACTIVITY_STORE_PATH', os.path.splitext(CSV_FILE_PATH)[0] + '.db'
+)
 
 # Ensure CSV file exists and has headers
 def ensure_csv_file(csv_file_path):
@@ -43,129 +66,176 @@ def ensure_csv_file(csv_file_path):
 
 ensure_csv_file(CSV_FILE_PATH)
 
+# Per-user indexed activity store; the existing CSV log is imported once
+activity_store = ActivityStore(ACTIVITY_STORE_PATH)
+activity_store.import_csv(CSV_FILE_PATH)
+
 # Activity priority mapping
 ACTIVITY_PRIORITY = {'select': 4, 'favourite': 3, 'view': 2, 'search': 1}
 
+# Category ancestry and product types, loaded once and refreshed when categories change
+category_cache = CategoryCache(max_age=app.config.get('CATEGORY_CACHE_MAX_AGE', 300))
+
+# Per-user favourite product sets, so a page needs at most one favourites query
+favourites_cache = FavouritesCache(max_age=app.config.get('FAVOURITES_CACHE_MAX_AGE', 300))
+
+# Materialized top-rated ranking, refreshed in the background; any page costs the same as the first
+top_rated_leaderboard = TopRatedLeaderboard(app, max_age=app.config.get('TOP_RATED_MAX_AGE', 300))
+
 # Initialize search and recommendation engines
-image_search_engine = ImageSearch(config_file_path='model.json')
-text_search_engine = TextSearch()
-content_based_filter = DeepContentBasedFiltering('model.json')
+text_search_engine = TextSearch(
+    refresh_interval=app.config.get('TEXT_SEARCH_REFRESH_INTERVAL', 5.0),
+    index_procs=app.config.get('TEXT_INDEX_PROCS', 1),
+    index_limitmb=app.config.get('TEXT_INDEX_LIMITMB', 128),
+    # 'memory' caches per process, 'sqlite' shares the cache between worker processes on the host
+    cache=create_query_cache(
+        app.config.get('TEXT_SEARCH_CACHE', 'memory'),
+        max_entries=app.config.get('TEXT_SEARCH_CACHE_SIZE', 1000),
+        ttl=app.config.get('TEXT_SEARCH_CACHE_TTL', 300),
+        path=app.config.get('TEXT_SEARCH_CACHE_PATH')
+    )
+)
+# Product changes committed through the ORM are re-indexed in the background
+text_index_updater = TextIndexUpdater(text_search_engine, app)
 
-# Initialize DQN agent
+# DQN settings
 STATE_SIZE = 10  # State size, can be adjusted
 ACTION_SIZE = 50  # Assume 50 actions (e.g., popular products)
-dqn_agent = DeepQNetwork(state_size=STATE_SIZE, action_size=ACTION_SIZE)
 
-# Load DQN model if it exists
-dqn_agent.load(MODEL_PATH)
+def load_image_search():
+    from search_engine import ImageSearch
+    return ImageSearch(config_file_path='model.json')
+
+def load_text_search():
+    # Opens the Whoosh index, building it first if it does not exist
+    with app.app_context():
+        text_search_engine.index
+    return text_search_engine
+
+def load_content_based_filter():
+    from recommendation_system import DeepContentBasedFiltering
+    return DeepContentBasedFiltering('model.json')
+
+def load_dqn_policy():
+    # Requests pick actions with a NumPy forward pass over the newest weight snapshot
+    # published by the trainer process; a new snapshot is swapped in without blocking requests
+    from recommendation_system import NumpyQNetwork
+    return NumpyQNetwork(snapshot_pointer_for(MODEL_PATH), action_size=ACTION_SIZE)
+
+# Engines load in parallel in the background ('background'), on first use ('lazy'),
+# or before the app serves anything ('eager'); routes degrade until an engine is ready
+engines = EngineRegistry(mode=app.config.get('ENGINE_LOADING', 'background'))
+engines.register('image_search', load_image_search)
+engines.register('text_search', load_text_search)
+engines.register('content_based', load_content_based_filter)
+engines.register('dqn', load_dqn_policy)
+engines.start()
 
 # Helper Functions
 def extract_state_from_db(user_id):
     logs = UserActivityLog.query.filter_by(user_id=user_id).order_by(
-        UserActivityLog.view_end_time.desc()
+        UserActivityLog.view_end_time.desc(), UserActivityLog.activity_id.desc()
     ).limit(STATE_SIZE).all()
     state = [log.product_id for log in logs]
     state += [0] * (STATE_SIZE - len(state))  # Padding if needed
     return np.array(state)
 
-def log_to_csv(user_id, product_id, activity_type):
+def write_csv_rows(rows):
     with open(CSV_FILE_PATH, mode='a', newline='', encoding='utf-8') as file:
         writer = csv.writer(file)
-        writer.writerow([user_id, product_id, activity_type, datetime.now()])
+        writer.writerows(rows)
+        file.flush()
+        os.fsync(file.fileno())
+
+def write_activity_store_rows(rows):
+    # A sink of its own, so a failed store write is retried without appending the CSV rows again
+    activity_store.append_many(rows)
+    invalidate_recommendations(user_id for user_id, _, _, _ in rows)
+
+def write_activity_logs(records):
+    # A session of its own rather than db.session in a pushed app context: under backpressure this runs
+    # in a request thread, where the app context teardown would commit and remove the request's session
+    with Session(bind=db.get_engine(app)) as activity_session:
+        activity_session.bulk_insert_mappings(UserActivityLog, records)
+        activity_session.commit()
+    invalidate_recommendations(record['user_id'] for record in records)
+
+def invalidate_recommendations(user_ids):
+    # Invalidated once the events are written, so the recomputed list includes them
+    for user_id in set(user_ids):
+        recommendation_cache.invalidate(user_id)
+
+# Activity events are queued and written in batches by a background thread
+activity_writer = ActivityWriter(
+    {'csv': write_csv_rows, 'store': write_activity_store_rows, 'db': write_activity_logs},
+    max_queue_size=app.config.get('ACTIVITY_QUEUE_SIZE', 10000),
+    batch_size=app.config.get('ACTIVITY_BATCH_SIZE', 500),
+    flush_interval=app.config.get('ACTIVITY_FLUSH_INTERVAL', 1.0),
+    # Retried; any other error rejects the record (e.g. a value the database does not accept)
+    transient_errors=(OSError, OperationalError, sqlite3.OperationalError)
+)
+
+def log_to_csv(user_id, product_id, activity_type):
+    row = (user_id, product_id, activity_type, datetime.now())
+    activity_writer.submit('csv', row)
+    activity_writer.submit('store', row)
 
 def log_user_activity(user_id, product_id, activity_type, quantity=1, view_end_time=None):
-    valid_activity_types = ['view', 'select', 'purchase', 'remove_from_cart', 'favourite', 'search']
+    # 'search' events only go to the CSV log: activity_type_enum in the database has no such value
+    valid_activity_types = ['view', 'select', 'purchase', 'remove_from_cart', 'favourite']
     if activity_type not in valid_activity_types:
         raise ValueError(f"Invalid activity type: {activity_type}")
 
-    activity_log = UserActivityLog(
-        user_id=user_id,
-        product_id=product_id,
-        activity_type=activity_type,
-        quantity=quantity,
-        view_end_time=view_end_time
-    )
-    db.session.add(activity_log)
-    db.session.commit()
+    # view_start_time is set here rather than by the server default, since the row is inserted later
+    activity_writer.submit('db', {
+        'user_id': user_id,
+        'product_id': product_id,
+        'activity_type': activity_type,
+        'quantity': quantity,
+        'view_start_time': datetime.now(timezone.utc),
+        'view_end_time': view_end_time
+    })
 
 def is_favourited(user_id, product_id):
-    if user_id:
-        favourite_entry = UserActivityLog.query.filter_by(
-            user_id=user_id, product_id=product_id, activity_type='favourite'
-        ).first()
-        return bool(favourite_entry)
-    return False
-
-def get_activity_score(activity_type):
-    score_mapping = {
-        'view': 1,
-        'favourite': 3,
-        'select': 2,
-        'remove_from_cart': -1,
-        'search': 0
-    }
-    return score_mapping.get(activity_type, 0)
-
-def categorize_product(category_id):
-    while category_id:
-        category = Category.query.get(category_id)
-        if not category:
-            break
-        if category.parent_category_id == 915:
-            return 'fashion'
-        elif category.parent_category_id == 316:
-            return 'book'
-        category_id = category.parent_category_id
-    return 'other'
-
-# Background Tasks
-def update_dqn_model():
-    with app.app_context():
-        while True:
-            print("Starting DQN training at regular intervals...")
-
-            # Get list of user_ids from the database
-            users = User.query.all()
-
-            for user in users:
-                user_id = user.user_id
-
-                # Extract the current state for the user
-                state = extract_state_from_db(user_id).reshape(1, -1)
-
-                # Get the latest activity log for the user
-                latest_log = UserActivityLog.query.filter_by(user_id=user_id).order_by(
-                    UserActivityLog.view_end_time.desc()
-                ).first()
+    return favourites_cache.status(user_id, [product_id])[product_id]
 
-                if latest_log:
-                    activity_type = latest_log.activity_type
-                    reward = get_activity_score(activity_type)
-                else:
-                    # Assign a default reward if no activity is found
-                    reward = 0
+def get_favourite_status(user_id, product_ids):
+    return favourites_cache.status(user_id, product_ids)
 
-                # Agent selects an action based on the current state
-                action = dqn_agent.act(state)
-
-                # Simulate the next state
-                next_state = extract_state_from_db(user_id).reshape(1, -1)
-
-                done = False  # Define end condition if necessary
-
-                # Train the DQN model
-                dqn_agent.remember(state, action, reward, next_state, done)
-                dqn_agent.replay()
+def get_products_with_tracking(product_ids):
+    # (product, tracking) pairs in the order of product_ids, skipping products without tracking
+    product_ids = [int(product_id) for product_id in product_ids]
+    if not product_ids:
+        return []
+    rows = db.session.query(Product, Tracking).join(
+        Tracking, Tracking.product_id == Product.product_id
+    ).filter(Product.product_id.in_(product_ids)).all()
+    by_id = {product.product_id: (product, tracking) for product, tracking in rows}
+    return [by_id[product_id] for product_id in product_ids if product_id in by_id]
 
-            # Save the model after training
-            dqn_agent.save(MODEL_PATH)
-            print(f"DQN model has been updated and saved at {MODEL_PATH}")
+def categorize_product(category_id):
+    return category_cache.category_type(category_id)
 
-            # Wait for the specified interval before the next training session
-            time.sleep(MODEL_UPDATE_INTERVAL)
+def get_product_type(product_id):
+    # None when the product has no category
+    return category_cache.product_type(product_id)
 
-# Start background thread to update model
-threading.Thread(target=update_dqn_model, daemon=True).start()
+# Background Tasks
+def start_dqn_worker():
+    # The DQN is trained in its own process so training never competes with requests for the GIL;
+    # the worker holds a lock, so only one trainer runs when several web processes start one
+    worker = subprocess.Popen([
+        sys.executable, '-m', 'recommendation_system.dqn_worker',
+        '--state-size', str(STATE_SIZE),
+        '--action-size', str(ACTION_SIZE),
+        '--parent-pid', str(os.getpid())
+    ])
+    atexit.register(worker.terminate)
+    return worker
+
+# 'process' starts the trainer alongside the app, 'external' expects it to be run separately
+if app.config.get('DQN_TRAINER', 'process') == 'process':
+    dqn_worker = start_dqn_worker()
 
 # Authentication Routes
 @app.route('/login', methods=['GET', 'POST'])
@@ -197,21 +267,48 @@ def logout_user():
 def index():
     return redirect(url_for('home'))
 
-def get_recommendations(user_id, limit=None):
-    # Fetch activity logs from CSV
-    activity_logs = []
-
-    if os.path.exists(CSV_FILE_PATH) and os.path.getsize(CSV_FILE_PATH) > 0:
-        with open(CSV_FILE_PATH, mode='r', newline='', encoding='utf-8') as file:
-            reader = csv.reader(file)
-            next(reader, None)  # Skip header
-            for row in reader:
-                if row[0] == str(user_id):
-                    activity_logs.append({
-                        'product_id': int(row[1]),
-                        'activity_type': row[2],
-                        'datetime': row[3]
-                    })
+# Health Routes
+@app.route('/healthz')
+def healthz():
+    # The process is up and serving; engines may still be loading
+    return jsonify({'status': 'ok', 'engines': engines.status()})
+
+@app.route('/readyz')
+def readyz():
+    ready = engines.is_ready()
+    return jsonify({'ready': ready, 'engines': engines.status()}), 200 if ready else 503
+
+def text_search_cache_stat(name):
+    cache = text_search_engine.cache
+    return None if cache is None else cache.stats()[name]
+
+tracer.register_metric(
+    'engine_ready', 'gauge', 'Whether an engine has finished loading.',
+    lambda: {name: int(engine['state'] == 'ready') for name, engine in engines.status().items()},
+    label='engine'
+)
+tracer.register_metric('text_search_cache_hits_total', 'counter', 'Text search query cache hits.',
+                       lambda: text_search_cache_stat('hits'))
+tracer.register_metric('text_search_cache_misses_total', 'counter', 'Text search query cache misses.',
+                       lambda: text_search_cache_stat('misses'))
+tracer.register_metric('text_search_cache_entries', 'gauge', 'Entries in the text search query cache.',
+                       lambda: text_search_cache_stat('size'))
+
+@app.route('/metrics')
+def metrics():
+    return Response(tracer.render_metrics(), mimetype='text/plain; version=0.0.4')
+
+def compute_recommended_ids(user_id):
+    # Fetch this user's activity logs from the activity store
+    with tracer.span('activity_store.events'):
+        activity_logs = [
+            {
+                'product_id': event['product_id'],
+                'activity_type': event['activity_type'],
+                'datetime': event['timestamp']
+            }
+            for event in activity_store.events(user_id)
+        ]
 
     if not activity_logs:
         return []
@@ -225,50 +322,67 @@ def get_recommendations(user_id, limit=None):
     # Get product_ids from activities
     interacted_product_ids = [log['product_id'] for log in activity_logs]
 
-    # DQN Recommendations
+    # DQN Recommendations (skipped while the policy is loading)
     dqn_recommended_ids = []
-    state = extract_state_from_db(user_id).reshape(1, -1)
-    action = dqn_agent.act(state)
-    if interacted_product_ids:
-        selected_product_id = interacted_product_ids[action % len(interacted_product_ids)]
-        dqn_recommended_ids.append(selected_product_id)
-
-    # Get similar products
+    dqn_policy = engines.get_if_ready('dqn')
+    if dqn_policy is not None:
+        with tracer.span('extract_state_from_db'):
+            state = extract_state_from_db(user_id).reshape(1, -1)
+        with tracer.span('dqn.act'):
+            action = dqn_policy.act(state)
+        if interacted_product_ids:
+            selected_product_id = interacted_product_ids[action % len(interacted_product_ids)]
+            dqn_recommended_ids.append(selected_product_id)
+
+    # Get similar products for all interacted products in one batched search
+    seed_product_ids = []
+    seed_product_types = []
+    unique_product_ids = list(dict.fromkeys(interacted_product_ids))
+    with tracer.span('category_cache.product_types'):
+        product_types = category_cache.product_types(unique_product_ids)
+    for product_id, product_type in zip(unique_product_ids, product_types):
+        if product_type is not None:
+            seed_product_ids.append(product_id)
+            seed_product_types.append(product_type)
     similar_product_ids = []
-    for product_id in interacted_product_ids:
-        product_category = ProductCategory.query.filter_by(product_id=product_id).first()
-        if product_category:
-            category_type = categorize_product(product_category.category_id)
-            similar_ids = content_based_filter.recommend(
-                product_id=product_id,
-                product_type=category_type,
+    content_based_filter = engines.get_if_ready('content_based')
+    if content_based_filter is not None:
+        with tracer.span('dcbf.recommend_many'):
+            similar_product_ids = content_based_filter.recommend_many(
+                seed_product_ids,
+                product_type=seed_product_types,
                 top_k=5,
                 exclude_viewed=False
             )
-            similar_product_ids.extend(similar_ids)
 
-    # Remove duplicates and limit number of products
-    all_recommended_ids = list(dict.fromkeys(
+    # Remove duplicates
+    return [int(product_id) for product_id in dict.fromkeys(
         interacted_product_ids + dqn_recommended_ids + similar_product_ids
-    ))
-    if limit:
-        all_recommended_ids = all_recommended_ids[:limit]
-
-    # Query products from the database
-    recommended_products_with_tracking = (
-        db.session.query(Product, Tracking)
-        .join(Tracking, Tracking.product_id == Product.product_id)
-        .filter(Product.product_id.in_(all_recommended_ids))
-        .all()
-    )
+    )]
+
+def recommendation_engines_ready():
+    # Lists computed while an engine is still loading are partial, so they are not cached
+    return all(engines.get_if_ready(name) is not None for name in ('dqn', 'content_based'))
+
+# Ranked recommendation ids per user, recomputed after the user's new activity is written
+recommendation_cache = RecommendationCache(
+    compute_recommended_ids, app,
+    max_users=app.config.get('RECOMMENDATION_CACHE_SIZE', 10000),
+    max_age=app.config.get('RECOMMENDATION_CACHE_MAX_AGE', 300),
+    stale_while_revalidate=app.config.get('RECOMMENDATION_CACHE_SWR', False)
+)
 
-    # Sort products according to order in all_recommended_ids
-    product_order_map = {pid: idx for idx, pid in enumerate(all_recommended_ids)}
-    recommended_products_with_tracking.sort(
-        key=lambda x: product_order_map.get(x[0].product_id, len(all_recommended_ids))
-    )
+def get_recommended_ids(user_id):
+    with tracer.span('recommendation_cache.get'):
+        return recommendation_cache.get(user_id, store=recommendation_engines_ready())
 
-    return recommended_products_with_tracking
+def get_recommendations(user_id, limit=None):
+    # (product, tracking) pairs of the first `limit` recommended products, in ranked order
+    product_ids = get_recommended_ids(user_id)
+    if limit:
+        product_ids = product_ids[:limit]
+    with tracer.span('hydrate_products'):
+        return get_products_with_tracking(product_ids)
 
 @app.route('/home')
 def home():
@@ -278,61 +392,51 @@ def home():
     user_id = session.get('user_id')
 
     # Get recommended products
-    recommended_products_with_tracking = get_recommendations(user_id, limit=16)
+    with tracer.span('get_recommendations'):
+        recommended_products_with_tracking = get_recommendations(user_id, limit=16)
 
     # Get top-rated products
-    top_rated_products = (
-        db.session.query(Product, Tracking)
-        .join(Tracking)
-        .order_by(Tracking.rating_average.desc(), Tracking.review_count.desc())
-        .limit(24)
-        .all()
-    )
+    with tracer.span('top_rated'):
+        top_rated_products = get_products_with_tracking(top_rated_leaderboard.page_ids(1, 24))
 
     # Favourite status
-    favourite_status_recommended = {
-        product.Product.product_id: is_favourited(user_id, product.Product.product_id)
-        for product in recommended_products_with_tracking
-    }
-    favourite_status_top_rated = {
-        product.Product.product_id: is_favourited(user_id, product.Product.product_id)
-        for product in top_rated_products
-    }
+    with tracer.span('favourite_status'):
+        favourite_status_recommended = get_favourite_status(
+            user_id, [product.product_id for product, _ in recommended_products_with_tracking]
+        )
+        favourite_status_top_rated = get_favourite_status(
+            user_id, [product.product_id for product, _ in top_rated_products]
+        )
 
     cart_count = len(session.get('cart', []))
     search_history = session.get('search_history', [])
 
-    return render_template(
-        'home.html',
-        recommended_products=recommended_products_with_tracking,
-        top_rated_products=top_rated_products,
-        favourite_status_recommended=favourite_status_recommended,
-        favourite_status_top_rated=favourite_status_top_rated,
-        cart_count=cart_count,
-        search_history=search_history
-    )
+    with tracer.span('render_template'):
+        return render_template(
+            'home.html',
+            recommended_products=recommended_products_with_tracking,
+            top_rated_products=top_rated_products,
+            favourite_status_recommended=favourite_status_recommended,
+            favourite_status_top_rated=favourite_status_top_rated,
+            cart_count=cart_count,
+            search_history=search_history
+        )
 
 # Product Browsing Routes
 @app.route('/top-rated/<int:page>')
 def show_top_rated(page=1):
     user_id = session.get('user_id')
     per_page = 48
-    start = (page - 1) * per_page
 
-    total_products = db.session.query(Tracking).count()
+    total_products = top_rated_leaderboard.count()
     total_pages = (total_products + per_page - 1) // per_page
 
-    top_rated_products = (
-        db.session.query(Product, Tracking)
-        .join(Tracking)
-        .order_by(Tracking.rating_average.desc(), Tracking.review_count.desc())
-        .offset(start).limit(per_page).all()
-    )
+    with tracer.span('top_rated'):
+        top_rated_products = get_products_with_tracking(top_rated_leaderboard.page_ids(page, per_page))
 
-    favourite_status_top_rated = {
-        product.Product.product_id: is_favourited(user_id, product.Product.product_id)
-        for product in top_rated_products
-    }
+    favourite_status_top_rated = get_favourite_status(
+        user_id, [product.product_id for product, _ in top_rated_products]
+    )
 
     cart_count = len(session.get('cart', []))
     search_history = session.get('search_history', [])
@@ -366,17 +470,19 @@ def view_product(product_id):
     tracking = Tracking.query.filter_by(product_id=product_id).first_or_404()
     favourite_status = is_favourited(user_id, product.product_id)
 
-    # Get similar products
-    product_category = ProductCategory.query.filter_by(product_id=product_id).first()
-    category_type = categorize_product(product_category.category_id)
-    similar_ids = content_based_filter.recommend(
-        product_id=product_id,
-        product_type=category_type,
-        top_k=9,
-        exclude_viewed=True,
-        viewed_product_ids=None,
-        content_based=True
-    )
+    # Get similar products (none while the content-based engine is loading)
+    category_type = get_product_type(product_id) or 'other'
+    similar_ids = []
+    content_based_filter = engines.get_if_ready('content_based')
+    if content_based_filter is not None:
+        with tracer.span('dcbf.recommend'):
+            similar_ids = content_based_filter.recommend(
+                product_id=product_id,
+                product_type=category_type,
+                top_k=9,
+                exclude_viewed=True,
+                viewed_product_ids=None
+            )
     similar_products = Product.query.filter(
         Product.product_id.in_(similar_ids)
     ).all()
@@ -389,10 +495,9 @@ def view_product(product_id):
     products_with_tracking = [
         (product, tracking_data.get(product.product_id)) for product in similar_products
     ]
-    favourite_status_similar = {
-        product.product_id: is_favourited(user_id, product.product_id)
-        for product, tracking in products_with_tracking
-    }
+    favourite_status_similar = get_favourite_status(
+        user_id, [product.product_id for product, tracking in products_with_tracking]
+    )
 
     highlight = (
         product.product_highlights.split(',')
@@ -544,26 +649,24 @@ def search_by_text():
             search_history.insert(0, query_str)
         session['search_history'] = search_history[:5]  # Keep only the 5 most recent terms
 
-        # Proceed with search logic
-        results = text_search_engine.search(query_str)
-
-        formatted_results = []
-        for product_id, _, _, _, _ in results:
-            product = Product.query.filter_by(product_id=product_id).first()
-            tracking = Tracking.query.filter_by(product_id=product_id).first()
-            if product and tracking:
-                formatted_results.append((product, tracking))
+        # Only the requested page is hydrated, with one query for products and their tracking rows
+        # While the index is still opening the page is rendered without results
+        text_search = engines.get_if_ready('text_search')
+        if text_search is not None:
+            with tracer.span('text_search.search_page'):
+                results, total_products = text_search.search_page(query_str, page=page, per_page=per_page)
+        else:
+            results, total_products = [], 0
+        with tracer.span('hydrate_products'):
+            paginated_results = get_products_with_tracking([product_id for product_id, _, _, _, _ in results])
 
-        # Log the first result if user is logged in
-        if 'user_id' in session:
+        # Log the top result if user is logged in; it is on the first page
+        if 'user_id' in session and page == 1:
             user_id = session.get('user_id')
-            for product, _ in formatted_results[:1]:
+            for product, _ in paginated_results[:1]:
                 log_to_csv(user_id, product.product_id, 'search')
-                log_user_activity(user_id, product.product_id, 'search', quantity=1)
 
-        total_products = len(formatted_results)
         total_pages = (total_products + per_page - 1) // per_page
-        paginated_results = formatted_results[(page - 1) * per_page: page * per_page]
     else:
         paginated_results = []
         total_pages = 0
@@ -592,17 +695,21 @@ def search_by_image():
     if uploaded_file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
 
+    image_search_engine = engines.get_if_ready('image_search')
+    if image_search_engine is None:
+        return jsonify({'error': 'Image search is starting up, please try again in a moment.'}), 503
+
     try:
         file_path = f'static/uploads/{uploaded_file.filename}'
         uploaded_file.save(file_path)
-        similar_ids = image_search_engine.upload_and_search(file_path)
+        with tracer.span('image_search.upload_and_search'):
+            similar_ids = image_search_engine.upload_and_search(file_path)
         uploaded_image_filename = uploaded_file.filename
 
-        # Log first product_id to CSV and database
+        # Log first product_id to CSV
         if 'user_id' in session and similar_ids:
             user_id = session.get('user_id')
             log_to_csv(user_id, similar_ids[0], 'search')
-            log_user_activity(user_id, similar_ids[0], 'search', quantity=1)
 
     except ValueError as e:
         return jsonify({'error': str(e)}), 400
@@ -631,18 +738,19 @@ def show_recommended(page=1):
     per_page = 48
     start = (page - 1) * per_page
 
-    recommended_products_with_tracking = get_recommendations(user_id)
+    with tracer.span('get_recommendations'):
+        recommended_ids = get_recommended_ids(user_id)
 
-    # Pagination
-    total_products = len(recommended_products_with_tracking)
+    # Pagination; only the visible page is hydrated
+    total_products = len(recommended_ids)
     total_pages = (total_products + per_page - 1) // per_page
-    paginated_products = recommended_products_with_tracking[start:start + per_page]
+    with tracer.span('hydrate_products'):
+        paginated_products = get_products_with_tracking(recommended_ids[start:start + per_page])
 
     # Favourite status
-    favourite_status = {
-        product.Product.product_id: is_favourited(user_id, product.Product.product_id)
-        for product in paginated_products
-    }
+    favourite_status = get_favourite_status(
+        user_id, [product.product_id for product, _ in paginated_products]
+    )
 
     cart_count = len(session.get('cart', []))
     search_history = session.get('search_history', [])
@@ -665,20 +773,23 @@ def content_based_recommendations(product_id, page=1):
     per_page = 24
 
     selected_product = Product.query.get_or_404(product_id)
-    product_category = ProductCategory.query.filter_by(product_id=product_id).first()
+    category_type = get_product_type(product_id)
 
-    if not product_category:
+    if category_type is None:
         return jsonify({'message': 'Product category not found.'}), 404
 
-    category_type = categorize_product(product_category.category_id)
-    similar_ids = content_based_filter.recommend(
-        product_id=product_id,
-        product_type=category_type,
-        top_k=10,
-        exclude_viewed=True,
-        viewed_product_ids=None,
-        content_based=True
-    )
+    content_based_filter = engines.get_if_ready('content_based')
+    if content_based_filter is None:
+        return jsonify({'message': 'Recommendations are starting up, please try again in a moment.'}), 503
+
+    with tracer.span('dcbf.recommend'):
+        similar_ids = content_based_filter.recommend(
+            product_id=product_id,
+            product_type=category_type,
+            top_k=10,
+            exclude_viewed=True,
+            viewed_product_ids=None
+        )
 
     similar_products = Product.query.filter(
         Product.product_id.in_(similar_ids)
@@ -724,8 +835,12 @@ def favourite_route():
         # Log 'favourite' activity
         log_user_activity(user_id, product_id, 'favourite')
         log_to_csv(user_id, product_id, 'favourite')
+        favourites_cache.add(user_id, product_id)
         return jsonify({'success': True, 'message': 'Product favourited'})
     elif activity_type == 'unfavourite':
+        # Make sure a favourite still waiting in the activity queue is in the database
+        activity_writer.flush(timeout=app.config.get('ACTIVITY_FLUSH_TIMEOUT', 5.0))
+
         # Remove 'favourite' activity
         activity = UserActivityLog.query.filter_by(
             user_id=user_id, product_id=product_id, activity_type='favourite'
@@ -733,6 +848,8 @@ def favourite_route():
         if activity:
             db.session.delete(activity)
             db.session.commit()
+            # Reload from the database: other 'favourite' rows for this product may remain
+            favourites_cache.invalidate(user_id)
             return jsonify({'success': True, 'message': 'Product unfavourited'})
         else:
             return jsonify({'error': 'Favourite activity not found'}), 404
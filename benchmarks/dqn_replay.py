@@ -0,0 +1,78 @@
+import argparse
+import json
+import time
+import numpy as np
+from recommendation_system import DeepQNetwork
+
+
+def legacy_replay(agent):
+    # The per-sample replay loop DeepQNetwork.replay used before it was vectorized
+    memory = agent.memory
+    for i in np.random.randint(0, len(memory), size=agent.batch_size):
+        state, action, reward = memory.states[i], memory.actions[i], memory.rewards[i]
+        next_state, done = memory.next_states[i], memory.dones[i]
+        state = np.reshape(state, [1, agent.state_size])
+        next_state = np.reshape(next_state, [1, agent.state_size])
+
+        target = reward
+        if not done:
+            target = reward + agent.gamma * np.amax(agent.model.predict(next_state, verbose=0)[0])
+
+        target_f = agent.model.predict(state, verbose=0)
+        target_f[0][action] = target
+        agent.model.fit(state, target_f, epochs=1, verbose=0)
+
+
+def fill_memory(agent, n, seed=0):
+    rng = np.random.default_rng(seed)
+    for _ in range(n):
+        state = rng.integers(0, 100000, size=(1, agent.state_size)).astype('float32')
+        next_state = rng.integers(0, 100000, size=(1, agent.state_size)).astype('float32')
+        agent.remember(state, int(rng.integers(agent.action_size)), float(rng.integers(-1, 4)), next_state, False)
+
+
+def time_calls(fn, repeats, warmup=2):
+    for _ in range(warmup):
+        fn()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats
+
+
+def run(state_size=10, action_size=50, batch_size=32, repeats=10, memory_size=2000, prioritized_replay=False):
+    agent = DeepQNetwork(
+        state_size=state_size, action_size=action_size, batch_size=batch_size,
+        memory_size=memory_size, prioritized_replay=prioritized_replay
+    )
+    fill_memory(agent, memory_size)
+
+    legacy_s = time_calls(lambda: legacy_replay(agent), repeats)
+    batched_s = time_calls(agent.replay, repeats)
+    return {
+        'batch_size': batch_size,
+        'prioritized_replay': prioritized_replay,
+        'legacy_ms_per_replay': legacy_s * 1000,
+        'batched_ms_per_replay': batched_s * 1000,
+        'legacy_samples_per_s': batch_size / legacy_s,
+        'batched_samples_per_s': batch_size / batched_s,
+        'speedup': legacy_s / batched_s,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark DeepQNetwork.replay against the per-sample loop.")
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--repeats', type=int, default=10)
+    parser.add_argument('--memory-size', type=int, default=2000)
+    parser.add_argument('--prioritized', action='store_true', help="Use prioritized replay")
+    args = parser.parse_args()
+    result = run(
+        batch_size=args.batch_size, repeats=args.repeats,
+        memory_size=args.memory_size, prioritized_replay=args.prioritized
+    )
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,19 @@
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.types import ARRAY
+from db.dbo import db
+
+
+@compiles(ARRAY, 'sqlite')
+def _compile_array_sqlite(type_, compiler, **kw):
+    # SQLite has no array type; the array columns (images, highlights) are left empty in benchmark catalogs
+    return 'TEXT'
+
+
+def sqlite_uri(path):
+    return f'sqlite:///{path}'
+
+
+def create_schema(app):
+    """Create every table of db/dbo.py in the app's (SQLite) database."""
+    with app.app_context():
+        db.create_all()
@@ -0,0 +1,203 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from .synthetic import WORDS, generate_catalog
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SIZES = [1000, 5000]
+
+
+def summarize(latencies, total_s):
+    ms = np.asarray(latencies) * 1000
+    return {
+        'calls': len(ms),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'mean_ms': float(ms.mean()),
+        'throughput_per_s': len(ms) / total_s,
+    }
+
+
+def measure(fn, inputs, warmup=3, memory_calls=20):
+    """
+    Latency percentiles and throughput of fn(*args) over `inputs`, then the peak of Python and NumPy
+    allocations (tracemalloc) over a separate pass, so tracing does not skew the timings.
+    """
+    for args in inputs[:warmup]:
+        fn(*args)
+
+    latencies = []
+    start = time.perf_counter()
+    for args in inputs:
+        call_start = time.perf_counter()
+        fn(*args)
+        latencies.append(time.perf_counter() - call_start)
+    result = summarize(latencies, time.perf_counter() - start)
+
+    tracemalloc.start()
+    for args in inputs[:memory_calls]:
+        fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result['peak_traced_mb'] = peak / 2 ** 20
+    return result
+
+
+def max_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def random_queries(rng, n, words=2):
+    return [(' '.join(rng.choice(WORDS, size=words)),) for _ in range(n)]
+
+
+def run_catalog(catalog, calls=200, image_calls=5, seed=0):
+    """
+    Benchmark one generated catalog through the real app module: its engines, caches and database.
+    Must run in a fresh process, since importing app loads config.py from the catalog directory.
+    """
+    os.chdir(catalog['workdir'])
+    sys.path[:0] = [catalog['workdir'], REPO_ROOT]
+    rng = np.random.default_rng(seed)
+
+    start = time.perf_counter()
+    import app as app_module
+    startup_s = time.perf_counter() - start
+    engines = app_module.engines
+    results = {
+        'n_products': catalog['n_products'],
+        'n_users': catalog['n_users'],
+        'startup_s': startup_s,
+        'engines': engines.status(),
+    }
+
+    product_ids = rng.integers(1, catalog['n_products'] + 1, size=calls)
+    dcbf = engines.get('content_based')
+    results['dcbf_recommend'] = measure(
+        dcbf.recommend,
+        [(int(pid), 'book' if pid % 2 == 0 else 'fashion', 10) for pid in product_ids]
+    )
+
+    image_search = engines.get('image_search')
+    results['image_upload_and_search'] = measure(
+        image_search.upload_and_search,
+        [(catalog['images'][i % len(catalog['images'])],) for i in range(image_calls)],
+        warmup=1, memory_calls=2
+    )
+
+    text_search = engines.get('text_search')
+    queries = random_queries(rng, calls)
+    with app_module.app.app_context():
+        # Uncached first, then through the app's query cache once every query has been seen
+        cache, text_search.cache = text_search.cache, None
+        results['text_search'] = measure(text_search.search, queries)
+        text_search.cache = cache
+        if cache is not None:
+            for query in queries:
+                text_search.search(*query)
+            results['text_search_cached'] = measure(text_search.search, queries)
+
+        # Uncached recomputation of the ranked ids, then the page path through the recommendation cache
+        user_ids = [(int(user_id),) for user_id in rng.integers(1, catalog['n_users'] + 1, size=calls)]
+        results['compute_recommended_ids'] = measure(app_module.compute_recommended_ids, user_ids)
+        results['get_recommendations'] = measure(app_module.get_recommendations, user_ids)
+
+    results['max_rss_mb'] = max_rss_mb()
+    return results
+
+
+def run_dqn_replay(calls=50, memory_size=2000, batch_size=32):
+    # Independent of the catalog size, so it runs once per suite
+    from recommendation_system import DeepQNetwork
+    from .dqn_replay import fill_memory
+
+    agent = DeepQNetwork(state_size=10, action_size=50, batch_size=batch_size, memory_size=memory_size)
+    fill_memory(agent, memory_size)
+    result = measure(agent.replay, [()] * calls, memory_calls=5)
+    result['samples_per_s'] = result['throughput_per_s'] * batch_size
+    result['batch_size'] = batch_size
+    return result
+
+
+def environment():
+    import faiss
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'faiss': faiss.__version__,
+    }
+
+
+def run_size_in_subprocess(catalog, calls, image_calls, seed):
+    # A fresh interpreter per size keeps imports, caches and peak RSS from leaking between sizes
+    with tempfile.NamedTemporaryFile('r', suffix='.json') as result_file:
+        subprocess.run(
+            [sys.executable, '-m', 'benchmarks.suite', '--worker', catalog['workdir'],
+             '--calls', str(calls), '--image-calls', str(image_calls), '--seed', str(seed),
+             '--result', result_file.name],
+            cwd=REPO_ROOT, check=True, stdout=sys.stderr
+        )
+        return json.load(result_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark search and recommendation paths on synthetic catalogs of several sizes."
+    )
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="Catalog sizes (products)")
+    parser.add_argument('--workdir', default=None, help="Where catalogs are generated (default: a temp dir)")
+    parser.add_argument('--events-per-user', type=int, default=20)
+    parser.add_argument('--calls', type=int, default=200, help="Calls per benchmark")
+    parser.add_argument('--image-calls', type=int, default=5, help="Calls for image search (VGG16 on CPU is slow)")
+    parser.add_argument('--replay-calls', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help="Write the JSON report here instead of stdout")
+    parser.add_argument('--worker', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--result', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        with open(os.path.join(args.worker, 'catalog.json'), 'r') as f:
+            catalog = json.load(f)
+        result = run_catalog(catalog, args.calls, args.image_calls, args.seed)
+        with open(args.result, 'w') as f:
+            json.dump(result, f)
+        return
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='bench-catalog-')
+    report = {'environment': environment(), 'args': vars(args), 'sizes': {}}
+    for size in args.sizes:
+        start = time.perf_counter()
+        catalog = generate_catalog(
+            os.path.join(workdir, f'catalog_{size}'), size,
+            events_per_user=args.events_per_user, seed=args.seed
+        )
+        with open(os.path.join(catalog['workdir'], 'catalog.json'), 'w') as f:
+            json.dump(catalog, f)
+        print(f"Generated catalog of {size} products in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+        report['sizes'][str(size)] = run_size_in_subprocess(catalog, args.calls, args.image_calls, args.seed)
+
+    report['dqn_replay'] = run_dqn_replay(args.replay_calls)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+import argparse
+import csv
+import json
+import os
+from datetime import datetime, timedelta
+import numpy as np
+from flask import Flask
+from db.dbo import (
+    Author, Category, Product, ProductAuthor, ProductCategory, Tracking, User, UserActivityLog, db
+)
+from .sqlite_schema import create_schema, sqlite_uri
+
+# Vector sizes of the model.json fields; images.npy must match the 4096-d VGG16 fc1 output
+DEFAULT_DIMS = {
+    'image': 4096,
+    'fashion': {'image': 256, 'category': 32, 'brand': 32},
+    'book': {'name': 256, 'category': 32, 'author': 32, 'publisher': 32},
+}
+FASHION_ROOT, BOOK_ROOT = 915, 316
+ACTIVITY_TYPES = ['view', 'view', 'view', 'select', 'favourite', 'remove_from_cart']
+WORDS = (
+    'ao quan vay giay tui mu dong ho kinh sach truyen tieu thuyet lich su khoa hoc '
+    'kinh te tam ly thieu nhi ky nang nau an du lich cotton len jean da lua '
+    'xanh do den trang vang nam nu tre em cao cap gia re moi ban chay'
+).split()
+
+CONFIG_TEMPLATE = '''class Config:
+    SECRET_KEY = 'benchmark'
+    SQLALCHEMY_DATABASE_URI = {database_uri!r}
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    MODEL_PATH = {model_path!r}
+    CSV_FILE_PATH = {csv_path!r}
+    MODEL_UPDATE_INTERVAL = 3600
+    DQN_TRAINER = 'external'
+    ENGINE_LOADING = 'eager'
+'''
+
+
+def clustered_vectors(rng, n, d, n_clusters=50):
+    # Clustered data, closer to real embeddings than uniform noise
+    centers = rng.normal(size=(n_clusters, d)).astype('float32')
+    labels = rng.integers(n_clusters, size=n)
+    return centers[labels] + 0.3 * rng.normal(size=(n, d)).astype('float32')
+
+
+def _words(rng, n):
+    return ' '.join(rng.choice(WORDS, size=n))
+
+
+def save_embeddings(path, id_field, ids, vectors):
+    # Same layout as the model files: a pickled dict of ids and lists of per-row vectors
+    data = {id_field: list(ids)}
+    for field, array in vectors.items():
+        data[field] = list(array)
+    np.save(path, data)
+
+
+def generate_embeddings(workdir, rng, fashion_ids, book_ids, dims):
+    paths = {
+        'images_vector': os.path.join(workdir, 'images.npy'),
+        'fashion': os.path.join(workdir, 'fashion.npy'),
+        'book': os.path.join(workdir, 'book.npy'),
+    }
+    save_embeddings(paths['images_vector'], 'index', fashion_ids,
+                    {'vector': clustered_vectors(rng, len(fashion_ids), dims['image'])})
+    for product_type, ids in (('fashion', fashion_ids), ('book', book_ids)):
+        save_embeddings(paths[product_type], 'product_id', ids, {
+            f'vector_{field}': clustered_vectors(rng, len(ids), dim)
+            for field, dim in dims[product_type].items()
+        })
+    return paths
+
+
+def generate_database(app, rng, n_products, n_users, events_per_user, start_time):
+    """Categories, products, authors, trackings, users and an activity log; returns the activity rows."""
+    fashion_categories = list(range(1000, 1020))
+    book_categories = list(range(2000, 2020))
+    n_authors = max(1, n_products // 20)
+
+    with app.app_context():
+        db.session.bulk_insert_mappings(Category, [
+            {'category_id': FASHION_ROOT, 'category_name': 'Thoi trang', 'parent_category_id': None},
+            {'category_id': BOOK_ROOT, 'category_name': 'Sach', 'parent_category_id': None},
+        ] + [
+            {'category_id': category_id, 'category_name': f'Danh muc {category_id}', 'parent_category_id': root}
+            for root, categories in ((FASHION_ROOT, fashion_categories), (BOOK_ROOT, book_categories))
+            for category_id in categories
+        ])
+        db.session.bulk_insert_mappings(Author, [
+            {'author_id': author_id, 'author_name': f'Tac gia {author_id} {_words(rng, 1)}'}
+            for author_id in range(1, n_authors + 1)
+        ])
+
+        products, product_categories, product_authors, trackings = [], [], [], []
+        for product_id in range(1, n_products + 1):
+            is_book = product_id % 2 == 0
+            products.append({
+                'product_id': product_id,
+                'sku': f'SKU{product_id:08d}',
+                'product_name': f'{"Sach" if is_book else "Thoi trang"} {_words(rng, 4)}',
+                'product_description': _words(rng, 30),
+                'product_price': float(rng.integers(10, 2000)) * 1000,
+            })
+            product_categories.append({
+                'product_id': product_id,
+                'category_id': int(rng.choice(book_categories if is_book else fashion_categories)),
+            })
+            if is_book:
+                product_authors.append({'product_id': product_id, 'author_id': int(rng.integers(1, n_authors + 1))})
+            trackings.append({
+                'track_id': product_id,
+                'product_id': product_id,
+                'discount': float(rng.integers(0, 50)),
+                'quantity_sold': int(rng.integers(0, 10000)),
+                'review_count': int(rng.integers(0, 5000)),
+                'rating_average': round(float(rng.uniform(1, 5)), 2),
+                'favorite_count': int(rng.integers(0, 1000)),
+            })
+        db.session.bulk_insert_mappings(Product, products)
+        db.session.bulk_insert_mappings(ProductCategory, product_categories)
+        db.session.bulk_insert_mappings(ProductAuthor, product_authors)
+        db.session.bulk_insert_mappings(Tracking, trackings)
+
+        db.session.bulk_insert_mappings(User, [
+            {'user_id': user_id, 'email': f'user{user_id}@example.com', 'password': 'benchmark',
+             'first_name': 'User', 'last_name': str(user_id)}
+            for user_id in range(1, n_users + 1)
+        ])
+
+        activities = []
+        for i in range(n_users * events_per_user):
+            activities.append({
+                'activity_id': i + 1,
+                'user_id': int(rng.integers(1, n_users + 1)),
+                'product_id': int(rng.integers(1, n_products + 1)),
+                'activity_type': str(rng.choice(ACTIVITY_TYPES)),
+                'quantity': 1,
+                'view_start_time': start_time + timedelta(seconds=i),
+                'view_end_time': start_time + timedelta(seconds=i + 5),
+            })
+        db.session.bulk_insert_mappings(UserActivityLog, activities)
+        db.session.commit()
+    return activities
+
+
+def write_activity_csv(path, activities):
+    with open(path, mode='w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(['user_id', 'product_id', 'activity_type', 'timestamp'])
+        for activity in activities:
+            writer.writerow([activity['user_id'], activity['product_id'], activity['activity_type'],
+                             activity['view_start_time']])
+
+
+def generate_sample_images(workdir, rng, count=4):
+    from PIL import Image
+
+    image_dir = os.path.join(workdir, 'images')
+    os.makedirs(image_dir, exist_ok=True)
+    paths = []
+    for i in range(count):
+        path = os.path.join(image_dir, f'sample_{i}.jpg')
+        Image.fromarray(rng.integers(0, 256, size=(224, 224, 3), dtype=np.uint8)).save(path)
+        paths.append(path)
+    return paths
+
+
+def generate_catalog(workdir, n_products=1000, n_users=None, events_per_user=20, dims=None, columnar=True,
+                     seed=0):
+    """
+    Write a self-contained synthetic catalog to `workdir`: a SQLite database with the db/dbo.py schema,
+    the activity CSV, the embedding files, a published DQN snapshot, sample query images, and the
+    model.json / config.py the app and engines read. Returns the paths as a dict.
+    """
+    from recommendation_system.dqn import DeepQNetwork
+    from search_engine.embedding_store import convert_embeddings
+
+    dims = dims or DEFAULT_DIMS
+    n_users = n_users or max(10, n_products // 50)
+    rng = np.random.default_rng(seed)
+    os.makedirs(workdir, exist_ok=True)
+    workdir = os.path.abspath(workdir)
+
+    database_path = os.path.join(workdir, 'catalog.db')
+    if os.path.exists(database_path):
+        os.remove(database_path)
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = sqlite_uri(database_path)
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    create_schema(app)
+
+    activities = generate_database(app, rng, n_products, n_users, events_per_user, datetime(2024, 1, 1))
+    csv_path = os.path.join(workdir, 'user_activity.csv')
+    write_activity_csv(csv_path, activities)
+
+    fashion_ids = np.arange(1, n_products + 1, 2, dtype=np.int64)
+    book_ids = np.arange(2, n_products + 1, 2, dtype=np.int64)
+    paths = generate_embeddings(workdir, rng, fashion_ids, book_ids, dims)
+    if columnar:
+        for path in paths.values():
+            convert_embeddings(path)
+
+    model_path = os.path.join(workdir, 'dqn_model.h5')
+    DeepQNetwork(state_size=10, action_size=50).save(model_path)
+
+    model_config = dict(paths, vgg16_weights=None, MODEL_PATH=model_path, CSV_FILE_PATH=csv_path)
+    with open(os.path.join(workdir, 'model.json'), 'w') as f:
+        json.dump(model_config, f, indent=4)
+    with open(os.path.join(workdir, 'config.py'), 'w') as f:
+        f.write(CONFIG_TEMPLATE.format(
+            database_uri=sqlite_uri(database_path), model_path=model_path, csv_path=csv_path
+        ))
+
+    return dict(
+        paths, workdir=workdir, database=database_path, csv=csv_path, model=model_path,
+        model_config=os.path.join(workdir, 'model.json'), images=generate_sample_images(workdir, rng),
+        n_products=n_products, n_users=n_users
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic catalog for benchmarks.")
+    parser.add_argument('workdir')
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--users', type=int, default=None)
+    parser.add_argument('--events-per-user', type=int, default=20)
+    parser.add_argument('--pickled', action='store_true', help="Keep only the pickled .npy embeddings")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    catalog = generate_catalog(
+        args.workdir, args.products, args.users, args.events_per_user,
+        columnar=not args.pickled, seed=args.seed
+    )
+    print(json.dumps(catalog, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+import argparse
+import json
+import time
+import numpy as np
+import faiss
+from search_engine.embedding_store import load_embeddings
+from search_engine.vector_index import build_index, index_memory_bytes, set_search_params
+
+# (name, index_type, build params) compared against the exact IndexFlatL2
+DEFAULT_OPTIONS = [
+    ('flat', 'flat', {}),
+    ('sq8', 'sq8', {}),
+    ('pq', 'pq', {}),
+    ('opq_pq', 'pq', {'pretransform': 'opq'}),
+    ('pca_sq8', 'sq8', {'pretransform': 'pca'}),
+    ('ivf_sq8', 'ivf_sq8', {}),
+    ('ivf_pq', 'ivf_pq', {}),
+    ('opq_ivf_pq', 'ivf_pq', {'pretransform': 'opq'}),
+]
+
+
+def synthetic_vectors(n, d, n_clusters=100, seed=0):
+    # Clustered data, closer to real embeddings than uniform noise
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, d)).astype('float32')
+    labels = rng.integers(n_clusters, size=n)
+    return centers[labels] + 0.3 * rng.normal(size=(n, d)).astype('float32')
+
+
+def load_vectors(path, field):
+    data = load_embeddings(path, fields=[field])
+    return np.ascontiguousarray(data[field], dtype='float32')
+
+
+def run_option(vectors, queries, expected, k, index_type, params, nprobe):
+    start = time.perf_counter()
+    index = build_index(vectors, index_type, **params)
+    build_s = time.perf_counter() - start
+    set_search_params(index, nprobe=nprobe)
+
+    latencies = []
+    found = []
+    for query in queries:
+        start = time.perf_counter()
+        _, rows = index.search(query.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found.append(rows[0])
+
+    hits = sum(len(np.intersect1d(e[e >= 0], f[f >= 0])) for e, f in zip(expected, found))
+    memory_bytes = index_memory_bytes(index)
+    return {
+        'index_type': index_type,
+        'params': params,
+        'build_s': build_s,
+        'memory_mb': memory_bytes / 2 ** 20,
+        'bytes_per_vector': memory_bytes / len(vectors),
+        'latency_ms_p50': float(np.percentile(latencies, 50)),
+        'latency_ms_p95': float(np.percentile(latencies, 95)),
+        f'recall@{k}': hits / float(expected.size),
+    }
+
+
+def run(vectors, k=10, n_queries=200, nprobe=16, options=None, seed=0, **build_params):
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.choice(len(vectors), min(n_queries, len(vectors)), replace=False)]
+
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, expected = exact.search(queries, k)
+
+    results = {'n': len(vectors), 'd': vectors.shape[1], 'k': k, 'queries': len(queries), 'options': {}}
+    for name, index_type, params in options or DEFAULT_OPTIONS:
+        params = dict(params, **build_params) if index_type != 'flat' else params
+        results['options'][name] = run_option(vectors, queries, expected, k, index_type, params, nprobe)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare memory, latency and recall@k of compressed FAISS indexes against IndexFlatL2."
+    )
+    parser.add_argument('--vectors', help="Embedding .npy file (e.g. model/Image/images.npy); synthetic data if omitted")
+    parser.add_argument('--field', default='vector', help="Vector field to index (e.g. vector, vector_image, vector_name)")
+    parser.add_argument('--n', type=int, default=10000, help="Synthetic vector count")
+    parser.add_argument('--d', type=int, default=256, help="Synthetic vector dimension")
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--nprobe', type=int, default=16)
+    parser.add_argument('--nlist', type=int, default=None, help="IVF lists (default: 4 * sqrt(n))")
+    parser.add_argument('--pq-m', type=int, default=None, help="PQ sub-quantizers, i.e. bytes per vector (default: up to d / 4)")
+    parser.add_argument('--pq-bits', type=int, default=8)
+    parser.add_argument('--options', nargs='*', default=None, help="Subset of: " + ', '.join(o[0] for o in DEFAULT_OPTIONS))
+    args = parser.parse_args()
+
+    if args.vectors:
+        vectors = load_vectors(args.vectors, args.field)
+    else:
+        vectors = synthetic_vectors(args.n, args.d)
+    options = [o for o in DEFAULT_OPTIONS if not args.options or o[0] in args.options]
+    build_params = {'nlist': args.nlist, 'pq_m': args.pq_m, 'pq_nbits': args.pq_bits}
+    result = run(
+        vectors, k=args.k, n_queries=args.queries, nprobe=args.nprobe, options=options,
+        **{key: value for key, value in build_params.items() if value is not None}
+    )
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+import argparse
+import csv
+import os
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS activities (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    product_id INTEGER NOT NULL,
+    activity_type TEXT NOT NULL,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_activities_user_seq ON activities (user_id, seq);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+COLUMNS = ('user_id', 'product_id', 'activity_type', 'timestamp')
+
+
+class ActivityStore:
+    """Append-only user activity log in a local SQLite file, indexed by (user_id, seq).
+
+    Per-user reads cost O(log n + k) for k events of that user, independent of
+    the total size of the log. The columns mirror user_activity.csv.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        # sqlite3 connections cannot be shared between threads, so keep one per thread
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def append(self, user_id, product_id, activity_type, timestamp):
+        self.append_many([(user_id, product_id, activity_type, timestamp)])
+
+    def append_many(self, rows):
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                'INSERT INTO activities (user_id, product_id, activity_type, timestamp) VALUES (?, ?, ?, ?)',
+                [(int(user_id), int(product_id), activity_type, str(timestamp))
+                 for user_id, product_id, activity_type, timestamp in rows]
+            )
+
+    def last_events(self, user_id, n):
+        """The `n` most recent events of a user, newest first."""
+        cursor = self._connection().execute(
+            'SELECT user_id, product_id, activity_type, timestamp FROM activities '
+            'WHERE user_id = ? ORDER BY seq DESC LIMIT ?',
+            (int(user_id), n)
+        )
+        return [dict(zip(COLUMNS, row)) for row in cursor]
+
+    def events(self, user_id):
+        """All events of a user, oldest first."""
+        cursor = self._connection().execute(
+            'SELECT user_id, product_id, activity_type, timestamp FROM activities '
+            'WHERE user_id = ? ORDER BY seq',
+            (int(user_id),)
+        )
+        return [dict(zip(COLUMNS, row)) for row in cursor]
+
+    def count(self):
+        return self._connection().execute('SELECT COUNT(*) FROM activities').fetchone()[0]
+
+    def import_csv(self, csv_path, batch_size=10000, force=False):
+        """Ingest an existing user_activity.csv.
+
+        The import is recorded in the store, so running it again (e.g. from
+        several workers at startup) is a no-op unless `force` is set.
+        Returns the number of imported rows.
+        """
+        if not os.path.exists(csv_path):
+            return 0
+
+        conn = self._connection()
+        key = f'imported:{os.path.abspath(csv_path)}'
+        imported = 0
+        skipped = 0
+        with conn:
+            # BEGIN IMMEDIATE takes the write lock, so concurrent imports run one after another
+            conn.execute('BEGIN IMMEDIATE')
+            if not force and conn.execute('SELECT 1 FROM meta WHERE key = ?', (key,)).fetchone():
+                return 0
+
+            with open(csv_path, mode='r', newline='', encoding='utf-8') as file:
+                reader = csv.reader(file)
+                next(reader, None)  # Skip header
+                batch = []
+                for row in reader:
+                    # Malformed or legacy rows are skipped so one bad line cannot stop the app from starting
+                    try:
+                        batch.append((int(row[0]), int(row[1]), row[2], row[3]))
+                    except (IndexError, ValueError):
+                        skipped += 1
+                        continue
+                    if len(batch) >= batch_size:
+                        conn.executemany(
+                            'INSERT INTO activities (user_id, product_id, activity_type, timestamp) VALUES (?, ?, ?, ?)',
+                            batch
+                        )
+                        imported += len(batch)
+                        batch = []
+                if batch:
+                    conn.executemany(
+                        'INSERT INTO activities (user_id, product_id, activity_type, timestamp) VALUES (?, ?, ?, ?)',
+                        batch
+                    )
+                    imported += len(batch)
+
+            conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(imported)))
+        if skipped:
+            print(f"Warning: skipped {skipped} malformed rows while importing {csv_path}")
+        return imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import user_activity.csv into an activity store.")
+    parser.add_argument('csv_path', help="Path to user_activity.csv")
+    parser.add_argument('store_path', help="Path to the SQLite activity store")
+    parser.add_argument('--force', action='store_true', help="Import again even if this CSV was already imported")
+    args = parser.parse_args()
+
+    store = ActivityStore(args.store_path)
+    imported = store.import_csv(args.csv_path, force=args.force)
+    print(f"Imported {imported} rows from {args.csv_path} into {args.store_path} ({store.count()} rows total)")
+
+
+if __name__ == '__main__':
+    main()
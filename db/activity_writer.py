@@ -0,0 +1,151 @@
+import atexit
+import queue
+import threading
+import time
+import traceback
+
+_FLUSH = object()
+_STOP = object()
+
+
+class ActivityWriter:
+    """Buffer activity records in a bounded queue and write them in batches off the request path.
+
+    `sinks` maps a record kind (e.g. 'csv', 'db') to a callable that writes a
+    list of records in one go. A background thread flushes every kind once
+    `batch_size` records are pending or `flush_interval` seconds have passed.
+    When the queue is full, `submit` blocks for up to `put_timeout` seconds
+    and then writes the record itself. When a batch write fails, its records
+    are written one at a time: a record that fails with one of
+    `transient_errors` (e.g. the database is unreachable) is kept and retried
+    on the next flush, any other failure means the record itself is bad, so
+    it is printed and set aside instead of blocking the records behind it.
+    While more than `max_queue_size` records wait for a retry the writer stops
+    taking new ones, so the queue fills and callers are slowed down instead.
+    """
+
+    def __init__(self, sinks, max_queue_size=10000, batch_size=500, flush_interval=1.0, put_timeout=2.0,
+                 transient_errors=(OSError,)):
+        self.sinks = sinks
+        self.transient_errors = transient_errors
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.max_queue_size = max_queue_size
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='activity-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, kind, record):
+        if kind not in self.sinks:
+            raise ValueError(f"Unknown activity sink: {kind}")
+        if self._closed:
+            self._write({kind: [record]})
+            return
+        try:
+            self._queue.put((kind, record), timeout=self.put_timeout)
+        except queue.Full:
+            # Backpressure: the writer is behind, so this caller pays for its own write;
+            # if that fails too, wait for room in the queue rather than drop the record
+            if self._write({kind: [record]}):
+                self._queue.put((kind, record))
+
+    def flush(self, timeout=None):
+        """
+        Block until everything submitted before this call has been written (or its write attempted).
+        Returns False when `timeout` seconds pass first.
+        """
+        if self._closed:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        done = threading.Event()
+        try:
+            self._queue.put((_FLUSH, done), timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+    def close(self, timeout=10.0):
+        if self._closed:
+            return
+        self.flush(timeout)
+        self._closed = True
+        try:
+            self._queue.put((_STOP, None), timeout=timeout)
+        except queue.Full:
+            print("Activity writer queue still full at exit; unwritten records are lost")
+            return
+        self._thread.join(timeout)
+
+    def _write(self, pending):
+        """Write each kind's records; returns the records to retry after a transient failure, by kind."""
+        failed = {}
+        for kind, records in pending.items():
+            if not records:
+                continue
+            try:
+                self.sinks[kind](records)
+                continue
+            except self.transient_errors:
+                print(f"Failed to write {len(records)} '{kind}' activity records, will retry:")
+                traceback.print_exc()
+                failed[kind] = records
+                continue
+            except Exception:
+                pass
+            # Isolate the bad records so they do not hold back the rest of the batch
+            retry = self._write_one_by_one(kind, records)
+            if retry:
+                failed[kind] = retry
+        return failed
+
+    def _write_one_by_one(self, kind, records):
+        retry = []
+        for record in records:
+            try:
+                self.sinks[kind]([record])
+            except self.transient_errors:
+                retry.append(record)
+            except Exception:
+                print(f"Dropping '{kind}' activity record that cannot be written: {record!r}")
+                traceback.print_exc()
+        if retry:
+            print(f"Failed to write {len(retry)} '{kind}' activity records, will retry")
+        return retry
+
+    def _run(self):
+        pending = {kind: [] for kind in self.sinks}
+        pending_count = 0
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            if pending_count >= self.max_queue_size:
+                # Too many records waiting for a retry: stop draining the queue until a retry succeeds
+                time.sleep(max(0.0, deadline - time.monotonic()))
+                kind, record = None, None
+            else:
+                try:
+                    kind, record = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    kind, record = None, None
+                else:
+                    if kind is not _FLUSH and kind is not _STOP:
+                        pending[kind].append(record)
+                        pending_count += 1
+                        if pending_count < self.batch_size and time.monotonic() < deadline:
+                            continue
+
+            # Size or time threshold reached, a flush was requested, or the writer is stopping
+            failed = self._write(pending)
+            pending = {kind_: failed.get(kind_, []) for kind_ in self.sinks}
+            pending_count = sum(len(records) for records in failed.values())
+            deadline = time.monotonic() + self.flush_interval
+
+            if kind is _STOP and pending_count:
+                print(f"Activity writer stopped with {pending_count} unwritten records")
+
+            if kind is _FLUSH:
+                record.set()
+            elif kind is _STOP:
+                return
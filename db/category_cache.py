@@ -0,0 +1,105 @@
+import threading
+import time
+import numpy as np
+from db.commit_events import on_commit
+from db.dbo import Category, ProductCategory, db
+
+# Categories directly under these roots decide the product type
+ROOT_CATEGORY_TYPES = {915: 'fashion', 316: 'book'}
+PRODUCT_TYPES = ('other', 'fashion', 'book')
+
+
+class CategoryCache:
+    """In-memory category ancestry and product -> product type lookup.
+
+    The whole `categories` table is loaded with one query and every category is
+    resolved to 'fashion', 'book' or 'other' by walking up to the 915/316
+    roots once. Product types are kept as sorted id/type arrays built from
+    `product_categories`. Both are reloaded on the next lookup after a change
+    to a Category or ProductCategory row is committed through the ORM, or
+    after `max_age` seconds for changes made by other processes.
+    """
+
+    def __init__(self, max_age=300):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._dirty = True
+        self._loaded_at = 0.0
+        self._category_types = {}
+        # (sorted product ids, type codes), replaced as one tuple so readers never mix two loads
+        self._product_types = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int8))
+
+        on_commit((Category, ProductCategory), self.invalidate)
+
+    def invalidate(self):
+        self._dirty = True
+
+    def _ensure_loaded(self):
+        if not self._dirty and time.monotonic() - self._loaded_at < self.max_age:
+            return
+        with self._lock:
+            if self._dirty or time.monotonic() - self._loaded_at >= self.max_age:
+                # Clear the flag first so a change during the reload triggers another one
+                self._dirty = False
+                self._reload()
+                self._loaded_at = time.monotonic()
+
+    def _reload(self):
+        parents = dict(db.session.query(Category.category_id, Category.parent_category_id).all())
+        category_types = {}
+        for category_id in parents:
+            # Walk up until a category with a known type, remembering the path to fill in afterwards
+            path = []
+            current = category_id
+            product_type = 'other'
+            while current and current in parents and current not in category_types:
+                if current in path:
+                    break  # Cycle in the category tree
+                path.append(current)
+                parent_id = parents[current]
+                if parent_id in ROOT_CATEGORY_TYPES:
+                    product_type = ROOT_CATEGORY_TYPES[parent_id]
+                    break
+                current = parent_id
+            else:
+                if current in category_types:
+                    product_type = category_types[current]
+            for visited_id in path:
+                category_types[visited_id] = product_type
+
+        # One category per product (the lowest category_id), as a sorted array for searchsorted lookups
+        rows = (
+            db.session.query(ProductCategory.product_id, ProductCategory.category_id)
+            .order_by(ProductCategory.product_id, ProductCategory.category_id)
+            .all()
+        )
+        product_ids = np.array([product_id for product_id, _ in rows], dtype=np.int64)
+        type_codes = np.array(
+            [PRODUCT_TYPES.index(category_types.get(category_id, 'other')) for _, category_id in rows],
+            dtype=np.int8
+        )
+        first = np.ones(len(product_ids), dtype=bool)
+        first[1:] = product_ids[1:] != product_ids[:-1]
+
+        self._category_types = category_types
+        self._product_types = (product_ids[first], type_codes[first])
+
+    def category_type(self, category_id):
+        self._ensure_loaded()
+        return self._category_types.get(category_id, 'other')
+
+    def product_types(self, product_ids):
+        """Product type for each id, or None for products without a category."""
+        self._ensure_loaded()
+        known_ids, known_codes = self._product_types
+        query = np.asarray([int(product_id) for product_id in product_ids], dtype=np.int64)
+        if not len(known_ids):
+            return [None] * len(query)
+
+        positions = np.minimum(np.searchsorted(known_ids, query), len(known_ids) - 1)
+        found = known_ids[positions] == query
+        codes = known_codes[positions]
+        return [PRODUCT_TYPES[code] if hit else None for code, hit in zip(codes, found)]
+
+    def product_type(self, product_id):
+        return self.product_types([product_id])[0]
@@ -0,0 +1,28 @@
+from itertools import chain
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+def on_commit(models, callback):
+    """
+    Call `callback()` after a Session commit that inserted, updated or deleted an instance of `models`.
+    Mapper events fire at flush time, before the commit, so a cache reloaded from them could read
+    pre-commit data; here changes are only noted at flush and acted on once committed.
+    """
+    models = tuple(models)
+    key = object()
+
+    def after_flush(session, flush_context):
+        if any(isinstance(instance, models) for instance in chain(session.new, session.dirty, session.deleted)):
+            session.info[key] = True
+
+    def after_commit(session):
+        if session.info.pop(key, False):
+            callback()
+
+    def after_rollback(session, previous_transaction):
+        session.info.pop(key, None)
+
+    event.listen(Session, 'after_flush', after_flush)
+    event.listen(Session, 'after_commit', after_commit)
+    event.listen(Session, 'after_soft_rollback', after_rollback)
@@ -0,0 +1,61 @@
+import threading
+import time
+from collections import OrderedDict
+from db.dbo import UserActivityLog, db
+
+
+class FavouritesCache:
+    """Per-user set of favourited product ids, loaded with one query per user.
+
+    At most `max_users` sets are kept (least recently used are evicted) and a
+    set is reloaded after `max_age` seconds, to pick up changes made by other
+    processes. `add` keeps the cached set in sync with the favourite route of
+    this process; unfavouriting calls `invalidate`, since other favourite
+    rows for the same product may remain in the database. Cached sets are
+    frozen and replaced rather than changed, so they can be read without the lock.
+    """
+
+    def __init__(self, max_users=10000, max_age=300):
+        self.max_users = max_users
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._favourites = OrderedDict()
+
+    def _load(self, user_id):
+        rows = db.session.query(UserActivityLog.product_id).filter_by(
+            user_id=user_id, activity_type='favourite'
+        ).all()
+        return frozenset(product_id for product_id, in rows)
+
+    def favourites(self, user_id):
+        with self._lock:
+            entry = self._favourites.get(user_id)
+            if entry is not None and time.monotonic() - entry[0] < self.max_age:
+                self._favourites.move_to_end(user_id)
+                return entry[1]
+
+        product_ids = self._load(user_id)
+        with self._lock:
+            self._favourites[user_id] = (time.monotonic(), product_ids)
+            self._favourites.move_to_end(user_id)
+            while len(self._favourites) > self.max_users:
+                self._favourites.popitem(last=False)
+        return product_ids
+
+    def status(self, user_id, product_ids):
+        """Map each product id to whether `user_id` has favourited it."""
+        if not user_id:
+            return {product_id: False for product_id in product_ids}
+        favourites = self.favourites(user_id)
+        return {product_id: int(product_id) in favourites for product_id in product_ids}
+
+    def add(self, user_id, product_id):
+        favourites = self.favourites(user_id) | {int(product_id)}
+        with self._lock:
+            entry = self._favourites.get(user_id)
+            if entry is not None:
+                self._favourites[user_id] = (entry[0], entry[1] | favourites)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._favourites.pop(user_id, None)
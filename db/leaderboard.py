@@ -0,0 +1,80 @@
+import threading
+import time
+import numpy as np
+from db.commit_events import on_commit
+from db.dbo import Product, Tracking, db
+
+
+class TopRatedLeaderboard:
+    """Materialized top-rated ranking: product ids ordered by rating, then review count.
+
+    The ranking is loaded with one id-only query and kept as an array, so any
+    page is a slice of it and costs the same as the first, and the total is
+    its length instead of a COUNT per page view. It is refreshed after
+    `max_age` seconds, or after a change to a Tracking row is committed
+    through the ORM. With an `app`, refreshes run in a background thread
+    while the previous ranking keeps being served; only the first load blocks.
+    """
+
+    def __init__(self, app=None, max_age=300):
+        self.app = app
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._dirty = True
+        self._refreshing = False
+        self._loaded_at = None
+        self._ranked_ids = np.empty(0, dtype=np.int64)
+
+        on_commit((Tracking,), self.invalidate)
+
+    def invalidate(self):
+        self._dirty = True
+
+    def _is_stale(self):
+        return self._dirty or time.monotonic() - self._loaded_at >= self.max_age
+
+    def _ensure_loaded(self):
+        if self._loaded_at is not None and not self._is_stale():
+            return
+        with self._lock:
+            if self._loaded_at is not None and (self._refreshing or not self._is_stale()):
+                return
+            # Clear the flag first so a change during the reload triggers another one
+            self._dirty = False
+            if self._loaded_at is not None and self.app is not None:
+                self._refreshing = True
+                threading.Thread(target=self._refresh_in_background, daemon=True).start()
+                return
+            self._reload()
+            self._loaded_at = time.monotonic()
+
+    def _refresh_in_background(self):
+        try:
+            with self.app.app_context():
+                self._reload()
+        except Exception as e:
+            print(f"Error refreshing top-rated leaderboard: {e}")
+        finally:
+            # After a failure the old ranking is kept and the refresh retried after max_age
+            self._loaded_at = time.monotonic()
+            self._refreshing = False
+
+    def _reload(self):
+        # Same order as the former per-page query; product_id breaks ties so pages never overlap
+        rows = (
+            db.session.query(Tracking.product_id)
+            .join(Product, Product.product_id == Tracking.product_id)
+            .order_by(Tracking.rating_average.desc(), Tracking.review_count.desc(), Tracking.product_id)
+            .all()
+        )
+        self._ranked_ids = np.array([product_id for product_id, in rows], dtype=np.int64)
+
+    def count(self):
+        self._ensure_loaded()
+        return len(self._ranked_ids)
+
+    def page_ids(self, page, per_page):
+        """Product ids on a 1-based page of the ranking."""
+        self._ensure_loaded()
+        start = max(page - 1, 0) * per_page
+        return self._ranked_ids[start:start + per_page].tolist()
@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class RecommendationCache:
+    """Per-user ranked recommendation id lists, computed by `compute(user_id)`.
+
+    At most `max_users` lists are kept (least recently used are evicted). A
+    list goes stale after `max_age` seconds or when `invalidate` is called for
+    its user, e.g. after new activity. A stale list is recomputed on the next
+    `get`; with `stale_while_revalidate` (and an `app` for the database
+    context) the stale list is returned immediately and recomputed in a
+    background thread instead.
+    """
+
+    def __init__(self, compute, app=None, max_users=10000, max_age=300, stale_while_revalidate=False):
+        self.compute = compute
+        self.app = app
+        self.max_users = max_users
+        self.max_age = max_age
+        self.stale_while_revalidate = stale_while_revalidate and app is not None
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        # Bumped by invalidate for users with a cached list or a computation in flight;
+        # a list computed before the latest bump is stale
+        self._versions = {}
+        self._computing = {}
+        self._refreshing = set()
+
+    def get(self, user_id, store=True):
+        """The cached id list of `user_id`, computing it on a miss; `store=False` computes without caching."""
+        if not store:
+            return self.compute(user_id)
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                self._entries.move_to_end(user_id)
+                product_ids, computed_at, version = entry
+                if version == self._versions.get(user_id, 0) and time.monotonic() - computed_at < self.max_age:
+                    return product_ids
+                if self.stale_while_revalidate:
+                    if user_id not in self._refreshing:
+                        self._refreshing.add(user_id)
+                        threading.Thread(target=self._refresh_in_background, args=(user_id,), daemon=True).start()
+                    return product_ids
+
+        return self._compute_and_store(user_id)
+
+    def _compute_and_store(self, user_id):
+        with self._lock:
+            version = self._versions.get(user_id, 0)
+            self._computing[user_id] = self._computing.get(user_id, 0) + 1
+        product_ids = None
+        try:
+            product_ids = self.compute(user_id)
+        finally:
+            with self._lock:
+                self._computing[user_id] -= 1
+                if not self._computing[user_id]:
+                    del self._computing[user_id]
+                if product_ids is not None:
+                    self._entries[user_id] = (product_ids, time.monotonic(), version)
+                    self._entries.move_to_end(user_id)
+                    while len(self._entries) > self.max_users:
+                        evicted_user_id, _ = self._entries.popitem(last=False)
+                        self._forget(evicted_user_id)
+                else:
+                    self._forget(user_id)
+        return product_ids
+
+    def _forget(self, user_id):
+        # Versions are only needed while a user has a cached list or a computation in flight
+        if user_id not in self._entries and user_id not in self._computing:
+            self._versions.pop(user_id, None)
+
+    def _refresh_in_background(self, user_id):
+        try:
+            with self.app.app_context():
+                self._compute_and_store(user_id)
+        except Exception as e:
+            print(f"Error refreshing recommendations for user {user_id}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(user_id)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            if user_id in self._entries or user_id in self._computing:
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
@@ -0,0 +1,112 @@
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+LOAD_MODES = ('background', 'lazy', 'eager')
+
+
+class EngineNotReady(RuntimeError):
+    pass
+
+
+class _Engine:
+    def __init__(self, name, factory, required):
+        self.name = name
+        self.factory = factory
+        self.required = required
+        self.state = 'pending'
+        self.value = None
+        self.error = None
+        self.started_at = None
+        self.load_seconds = None
+        self.loaded = threading.Event()
+
+
+class EngineRegistry:
+    """Load search and recommendation engines off the request path.
+
+    Each engine is registered with a factory. In 'background' mode all
+    factories start in parallel as soon as `start` is called; in 'lazy' mode an
+    engine starts loading on its first `get`; 'eager' loads everything in
+    parallel and waits, like a plain import-time load. Until an engine is
+    ready, `get` raises EngineNotReady and `get_if_ready` returns None, so
+    routes can serve a reduced page instead of blocking.
+    """
+
+    def __init__(self, mode='background', max_workers=4):
+        if mode not in LOAD_MODES:
+            raise ValueError(f"Unknown engine load mode: {mode}")
+        self.mode = mode
+        self._engines = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='engine-loader')
+
+    def register(self, name, factory, required=True):
+        """`required` engines must be loaded for the app to report ready."""
+        self._engines[name] = _Engine(name, factory, required)
+
+    def start(self):
+        if self.mode == 'lazy':
+            return
+        for engine in self._engines.values():
+            self._load_async(engine)
+        if self.mode == 'eager':
+            for engine in self._engines.values():
+                engine.loaded.wait()
+
+    def _load_async(self, engine):
+        with self._lock:
+            if engine.state != 'pending':
+                return
+            engine.state = 'loading'
+            engine.started_at = time.time()
+        self._executor.submit(self._load, engine)
+
+    def _load(self, engine):
+        start = time.perf_counter()
+        try:
+            engine.value = engine.factory()
+            engine.state = 'ready'
+        except Exception as e:
+            traceback.print_exc()
+            engine.error = f'{type(e).__name__}: {e}'
+            engine.state = 'failed'
+        engine.load_seconds = time.perf_counter() - start
+        engine.loaded.set()
+        print(f"Engine {engine.name} {engine.state} in {engine.load_seconds:.1f}s")
+
+    def get(self, name, timeout=0):
+        """The loaded engine; waits up to `timeout` seconds, then raises EngineNotReady."""
+        engine = self._engines[name]
+        if engine.state == 'pending':
+            self._load_async(engine)
+        if timeout and not engine.loaded.is_set():
+            engine.loaded.wait(timeout)
+        if engine.state != 'ready':
+            raise EngineNotReady(f"Engine {name} is {engine.state}")
+        return engine.value
+
+    def get_if_ready(self, name):
+        try:
+            return self.get(name)
+        except EngineNotReady:
+            return None
+
+    def is_ready(self):
+        required = [engine for engine in self._engines.values() if engine.required]
+        if self.mode == 'lazy':
+            # Lazy engines load on first use, so only a failed load makes the app unready
+            return all(engine.state != 'failed' for engine in required)
+        return all(engine.state == 'ready' for engine in required)
+
+    def status(self):
+        return {
+            name: {
+                'state': engine.state,
+                'required': engine.required,
+                'load_seconds': engine.load_seconds,
+                'error': engine.error,
+            }
+            for name, engine in self._engines.items()
+        }
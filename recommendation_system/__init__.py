@@ -1,2 +1,16 @@
-from .dcbf import DeepContentBasedFiltering
-from .dqn import DeepQNetwork
\ No newline at end of file
+import importlib
+
+# Submodules are imported on first access, so serving with NumpyQNetwork does not
+# pull in TensorFlow through DeepQNetwork
+_EXPORTS = {
+    'DeepContentBasedFiltering': '.dcbf',
+    'DeepQNetwork': '.dqn',
+    'NumpyQNetwork': '.dqn_inference',
+    'IncrementalDQNTrainer': '.dqn_trainer',
+}
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(_EXPORTS[name], __name__), name)
@@ -1,199 +1,290 @@
 import numpy as np
 import faiss
 import json
-import os
+from search_engine.embedding_store import embedding_source_path, load_embeddings
+from search_engine.vector_index import (
+    INDEX_TYPES, build_params_from_config, index_path_for, index_tag, load_or_build_index,
+    set_search_params
+)
+from .neighbor_table import load_neighbor_table
+
+# Với mỗi loại sản phẩm: vector dùng để tìm kiếm bằng FAISS và các vector dùng để xếp hạng lại
+PRODUCT_FIELDS = {
+    'fashion': ('image', ['category', 'brand']),
+    'book': ('name', ['category', 'author', 'publisher']),
+}
 
 class DeepContentBasedFiltering:
-    def __init__(self, model_config_path):
+    def __init__(self, model_config_path, use_neighbor_table=True):
         """
         Khởi tạo lớp với đường dẫn đến tệp cấu hình model.json.
         :param model_config_path: Đường dẫn đến tệp model.json.
+        :param use_neighbor_table: Dùng bảng láng giềng tính trước (nếu có) thay cho tìm kiếm trực tiếp.
         """
         # Tải cấu hình model
         with open(model_config_path, 'r') as f:
-            self.model_paths = json.load(f)
-        
+            config = json.load(f)
+
         # Chỉ giữ lại các model cho fashion và book
-        self.model_paths = {k: v for k, v in self.model_paths.items() if k in ['fashion', 'book']}
-        
+        self.model_paths = {k: v for k, v in config.items() if k in PRODUCT_FIELDS}
+
+        # Cấu hình chỉ mục FAISS: mục "<loại>_index" (ví dụ "fashion_index"), nếu không có thì dùng "content_index".
+        # Cùng các khóa với "images_index" của ImageSearch; mặc định là IndexFlatL2 chính xác.
+        self.index_configs = {
+            product_type: config.get(f'{product_type}_index', config.get('content_index', {}))
+            for product_type in self.model_paths
+        }
+
         # Từ điển lưu trữ dữ liệu cho mỗi loại sản phẩm
         self.data = {}
         self.indices = {}
-        
+        # Ánh xạ product_id -> vị trí dòng trong dữ liệu, cho mỗi loại sản phẩm
+        self.row_index = {}
+        # Bảng top-K láng giềng tính trước (memory-map), cho mỗi loại sản phẩm
+        self.neighbor_tables = {}
+
         # Tải dữ liệu và xây dựng chỉ mục cho từng loại sản phẩm (fashion và book)
         for product_type, model_path in self.model_paths.items():
             self.load_data(product_type, model_path)
             self.build_indices(product_type)
-    
+            if use_neighbor_table:
+                table = load_neighbor_table(model_path, len(self.data[product_type]['product_id']))
+                if table is not None:
+                    self.neighbor_tables[product_type] = table
+
     def load_data(self, product_type, model_path):
         """
-        Tải dữ liệu từ tệp .npy cho một loại sản phẩm.
+        Tải dữ liệu cho một loại sản phẩm, ưu tiên kho vector dạng cột (memory-map) nếu đã chuyển đổi.
         :param product_type: Loại sản phẩm ('fashion' hoặc 'book').
         :param model_path: Đường dẫn đến tệp .npy chứa dữ liệu.
         """
-        if not os.path.exists(model_path):
-            raise FileNotFoundError(f"Model file not found: {model_path}")
-        
-        # Nạp dữ liệu từ tệp .npy
-        data = np.load(model_path, allow_pickle=True).item()
-        
-        # Đảm bảo product_id luôn là kiểu Python int thay vì numpy int
-        data['product_id'] = [int(pid) for pid in data['product_id']]  # Chuyển đổi từng giá trị sang Python int
-        
+        # Mỗi trường vector là một mảng (n, d) float32; với kho dạng cột, các tiến trình dùng chung qua page cache
+        data = load_embeddings(model_path)
+
+        # Lưu product_id dưới dạng mảng int64 để ánh xạ ngược từ vị trí dòng
+        data['product_id'] = np.asarray(data['product_id'], dtype=np.int64)
+
         # Lưu dữ liệu vào từ điển
         self.data[product_type] = data
-    
+        self.row_index[product_type] = {int(pid): row for row, pid in enumerate(data['product_id'])}
+
     def build_indices(self, product_type):
         """
         Xây dựng chỉ mục FAISS cho một loại sản phẩm.
         :param product_type: Loại sản phẩm ('fashion' hoặc 'book').
         """
+        if product_type not in PRODUCT_FIELDS:
+            raise ValueError(f"Unknown product type: {product_type}")
+
         data = self.data[product_type]
+        search_field, rerank_fields = PRODUCT_FIELDS[product_type]
         indices = {}
-        
-        # Tùy thuộc vào loại sản phẩm, xây dựng chỉ mục dựa trên vector tương ứng
-        if product_type == 'fashion':
-            # Chỉ mục cho vector hình ảnh
-            vector_images = np.vstack(data['vector_image']).astype('float32')
-            d_image = vector_images.shape[1]
-            index_image = faiss.IndexFlatL2(d_image)
-            index_image.add(vector_images)
-            indices['image'] = index_image
-            
-            # Lưu trữ vector category và brand
-            indices['category'] = np.vstack(data['vector_category'])
-            indices['brand'] = np.vstack(data['vector_brand'])
-        
-        elif product_type == 'book':
-            # Chỉ mục cho vector tên sản phẩm
-            vector_names = np.vstack(data['vector_name']).astype('float32')
-            d_name = vector_names.shape[1]
-            index_name = faiss.IndexFlatL2(d_name)
-            index_name.add(vector_names)
-            indices['name'] = index_name
-            
-            # Lưu trữ vector category, author, publisher
-            indices['category'] = np.vstack(data['vector_category'])
-            indices['author'] = np.vstack(data['vector_author'])
-            indices['publisher'] = np.vstack(data['vector_publisher'])
-        
+
+        # Chỉ mục FAISS cho vector chính (hình ảnh với fashion, tên sản phẩm với book)
+        vectors = data[f'vector_{search_field}']
+        index_config = self.index_configs.get(product_type, {})
+        index_type = index_config.get('type', 'flat')
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type: {index_type}")
+
+        if index_type == 'flat':
+            index = faiss.IndexFlatL2(vectors.shape[1])
+            index.add(np.ascontiguousarray(vectors, dtype='float32'))
         else:
-            raise ValueError(f"Unknown product type: {product_type}")
-        
+            # Chỉ mục xấp xỉ hoặc nén được lưu cạnh tệp dữ liệu và dùng lại ở các lần khởi động sau
+            build_params = build_params_from_config(index_config)
+            model_path = self.model_paths[product_type]
+            index_path = index_config.get('path') or index_path_for(
+                model_path, index_type, index_tag(index_type, vectors.shape[1], len(vectors), **build_params)
+            )
+            index, built = load_or_build_index(
+                vectors, index_path, index_type,
+                source_path=embedding_source_path(model_path), **build_params
+            )
+            set_search_params(index, nprobe=index_config.get('nprobe', 8), ef_search=index_config.get('efSearch', 64))
+            if built:
+                print(f"Chỉ mục {index_type} cho {product_type} đã được xây dựng và lưu tại {index_path}")
+        indices[search_field] = index
+
+        # Lưu trữ các vector dùng để xếp hạng lại (category, brand, author, publisher)
+        for field in rerank_fields:
+            indices[field] = np.asarray(data[f'vector_{field}'], dtype='float32')
+
         # Lưu chỉ mục vào self.indices
         self.indices[product_type] = indices
-    
-    def recommend(self, product_id, product_type, top_k=10, exclude_viewed=True, viewed_product_ids=None):
+
+    def _score_candidates(self, product_type, query_rows, candidate_rows, distances):
         """
-        Gợi ý sản phẩm tương tự dựa trên product_id và product_type.
-        :param product_id: ID của sản phẩm cần tìm.
-        :param product_type: Loại sản phẩm ('fashion' hoặc 'book').
-        :param top_k: Số lượng sản phẩm gợi ý.
-        :param exclude_viewed: Loại bỏ các sản phẩm đã xem hay không.
-        :param viewed_product_ids: Danh sách các product_id đã xem.
-        :return: Danh sách các product_id được gợi ý hoặc [] nếu product_id không hợp lệ.
+        Tính điểm tổng hợp cho các ứng viên của nhiều truy vấn cùng lúc.
+        :param query_rows: Mảng (nq,) vị trí dòng của các sản phẩm truy vấn.
+        :param candidate_rows: Mảng (nq, m) vị trí dòng ứng viên do FAISS trả về (-1 nếu không có).
+        :param distances: Mảng (nq, m) khoảng cách FAISS tương ứng.
+        :return: Mảng (nq, m) điểm tổng hợp; ứng viên không hợp lệ có điểm inf.
         """
-        data = self.data.get(product_type)
-        if data is None:
-            return []  # Return empty list if the product_type is not found
-
-        indices = self.indices.get(product_type)
-        if indices is None:
-            return []  # Return empty list if the indices are not found
+        indices = self.indices[product_type]
+        _, rerank_fields = PRODUCT_FIELDS[product_type]
+        n_rows = len(self.data[product_type]['product_id'])
 
-        # Kiểm tra xem product_id có trong dữ liệu không
-        if product_id not in data['product_id']:
-            return []  # Trả về danh sách rỗng nếu product_id không tồn tại
-
-        # Lấy vị trí của product_id trong mảng
-        idx = data['product_id'].index(product_id)
+        valid = (candidate_rows >= 0) & (candidate_rows < n_rows)
+        safe_rows = np.where(valid, candidate_rows, 0)
 
-        if product_type == 'fashion':
-            query_vector_image = data['vector_image'][idx].astype('float32')
-            query_vector_category = data['vector_category'][idx]
-            query_vector_brand = data['vector_brand'][idx]
+        scores = distances.astype('float32', copy=True)
+        for field in rerank_fields:
+            field_vectors = indices[field]
+            diff = field_vectors[safe_rows] - field_vectors[query_rows][:, None, :]
+            scores += np.linalg.norm(diff, axis=2)
 
-            # Search using FAISS
-            distances, indices_image = self.indices[product_type]['image'].search(np.array([query_vector_image]), top_k * 3)
-            candidate_indices = indices_image[0]
+        scores[~valid] = np.inf
+        return scores
 
-            # Ensure indices are valid (within the bounds of all arrays)
-            valid_candidate_indices = [i for i in candidate_indices if i < len(data['product_id'])]
+    def _select_top_k(self, product_type, candidate_rows, scores, top_k, excluded_ids=None):
+        """
+        Chọn top_k ứng viên có điểm thấp nhất của một truy vấn, bỏ qua các product_id bị loại trừ.
+        :return: Danh sách product_id theo thứ tự điểm tăng dần.
+        """
+        product_ids = self.data[product_type]['product_id']
+        candidate_ids = product_ids[np.where(candidate_rows >= 0, candidate_rows, 0)]
 
-            # Get the corresponding product IDs
-            candidate_product_ids = [data['product_id'][i] for i in valid_candidate_indices]
+        scores = scores.copy()
+        if excluded_ids:
+            scores[np.isin(candidate_ids, list(excluded_ids))] = np.inf
 
-            # Ensure all indices are valid for category and brand arrays
-            valid_candidate_indices = [i for i in valid_candidate_indices 
-                                    if i < len(self.indices[product_type]['category']) 
-                                    and i < len(self.indices[product_type]['brand'])]
+        k = min(top_k, int(np.isfinite(scores).sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(scores, k - 1)[:k]
+        top = top[np.argsort(scores[top], kind='stable')]
+        return candidate_ids[top].tolist()
 
-            candidate_categories = self.indices[product_type]['category'][valid_candidate_indices]
-            category_distances = np.linalg.norm(candidate_categories - query_vector_category, axis=1)
+    def _neighbors_from_table(self, product_type, row, top_k, excluded_ids):
+        """
+        Lấy gợi ý từ bảng láng giềng tính trước.
+        :return: Danh sách product_id, hoặc None nếu bảng không có hoặc không đủ ứng viên sau khi loại trừ.
+        """
+        table = self.neighbor_tables.get(product_type)
+        if table is None or top_k > table[0].shape[1]:
+            return None
 
-            candidate_brands = self.indices[product_type]['brand'][valid_candidate_indices]
-            brand_distances = np.linalg.norm(candidate_brands - query_vector_brand, axis=1)
+        neighbor_rows = np.asarray(table[0][row])
+        neighbor_rows = neighbor_rows[neighbor_rows >= 0]
+        neighbor_ids = self.data[product_type]['product_id'][neighbor_rows]
+        if excluded_ids:
+            neighbor_ids = neighbor_ids[~np.isin(neighbor_ids, list(excluded_ids))]
 
-            total_distances = distances[0][:len(valid_candidate_indices)] + category_distances + brand_distances
-            recommendations = list(zip(candidate_product_ids, total_distances))
+        # Bảng bị cắt ở top-K: nếu loại trừ làm thiếu ứng viên thì phải tìm kiếm trực tiếp
+        if len(neighbor_ids) < top_k and len(neighbor_rows) == table[0].shape[1]:
+            return None
+        return neighbor_ids[:top_k].tolist()
 
-            # Loại bỏ chính sản phẩm đang xem
-            #recommendations = [rec for rec in recommendations if rec[0] != product_id]
+    def recommend(self, product_id, product_type, top_k=10, exclude_viewed=True, viewed_product_ids=None):
+        """
+        Gợi ý sản phẩm tương tự dựa trên product_id và product_type.
+        :param product_id: ID của sản phẩm cần tìm.
+        :param product_type: Loại sản phẩm ('fashion' hoặc 'book').
+        :param top_k: Số lượng sản phẩm gợi ý.
+        :param exclude_viewed: Loại bỏ các sản phẩm đã xem hay không.
+        :param viewed_product_ids: Danh sách các product_id đã xem.
+        :return: Danh sách các product_id được gợi ý hoặc [] nếu product_id không hợp lệ.
+        """
+        if product_type not in self.data or product_type not in self.indices:
+            return []  # Return empty list if the product_type is not found
 
-            # Loại bỏ các sản phẩm đã xem nếu cần
-            if exclude_viewed and viewed_product_ids is not None:
-                recommendations = [rec for rec in recommendations if rec[0] not in viewed_product_ids]
-            if exclude_viewed:
-                recommendations = [rec for rec in recommendations if rec[0] != product_id]
+        # Tra cứu vị trí của product_id trong O(1)
+        row = self.row_index[product_type].get(product_id)
+        if row is None:
+            return []  # Trả về danh sách rỗng nếu product_id không tồn tại
 
-            recommendations.sort(key=lambda x: x[1])
-            recommended_product_ids = [rec[0] for rec in recommendations[:top_k]]
+        # Loại bỏ chính sản phẩm đang xem và các sản phẩm đã xem nếu cần
+        excluded_ids = set()
+        if exclude_viewed:
+            excluded_ids.add(product_id)
+            if viewed_product_ids is not None:
+                excluded_ids.update(viewed_product_ids)
 
-        elif product_type == 'book':
-            # Tương tự cho loại sản phẩm book
-            query_vector_name = data['vector_name'][idx].astype('float32')
-            query_vector_category = data['vector_category'][idx]
-            query_vector_author = data['vector_author'][idx]
-            query_vector_publisher = data['vector_publisher'][idx]
+        # Ưu tiên bảng láng giềng tính trước, chỉ tìm kiếm trực tiếp khi bảng không đáp ứng được
+        recommended_product_ids = self._neighbors_from_table(product_type, row, top_k, excluded_ids)
+        if recommended_product_ids is not None:
+            return recommended_product_ids
 
-            distances, indices_name = self.indices[product_type]['name'].search(np.array([query_vector_name]), top_k * 3)
-            candidate_indices = indices_name[0]
+        search_field, _ = PRODUCT_FIELDS[product_type]
+        index = self.indices[product_type][search_field]
+        query_vector = np.asarray(self.data[product_type][f'vector_{search_field}'][row], dtype='float32')
 
-            # Ensure indices are valid (within the bounds of all arrays)
-            valid_candidate_indices = [i for i in candidate_indices if i < len(data['product_id'])]
+        # Search using FAISS
+        distances, candidate_rows = index.search(query_vector.reshape(1, -1), top_k * 3)
+        scores = self._score_candidates(product_type, np.array([row]), candidate_rows, distances)
 
-            candidate_product_ids = [data['product_id'][i] for i in valid_candidate_indices]
+        return self._select_top_k(product_type, candidate_rows[0], scores[0], top_k, excluded_ids)
 
-            # Ensure all indices are valid for category, author, and publisher arrays
-            valid_candidate_indices = [i for i in valid_candidate_indices 
-                                    if i < len(self.indices[product_type]['category']) 
-                                    and i < len(self.indices[product_type]['author']) 
-                                    and i < len(self.indices[product_type]['publisher'])]
+    def recommend_many(self, product_ids, product_type=None, top_k=10, exclude_viewed=False, viewed_product_ids=None):
+        """
+        Gợi ý sản phẩm tương tự cho nhiều sản phẩm cùng lúc, với một lần tìm kiếm FAISS cho mỗi loại sản phẩm.
+        :param product_ids: Danh sách các product_id cần tìm.
+        :param product_type: Loại sản phẩm chung ('fashion' hoặc 'book'), danh sách loại tương ứng
+                             với từng product_id, hoặc None để tự xác định loại theo dữ liệu đã nạp.
+        :param top_k: Số lượng sản phẩm gợi ý cho mỗi product_id.
+        :param exclude_viewed: Loại bỏ các sản phẩm đã xem hay không.
+        :param viewed_product_ids: Danh sách các product_id đã xem.
+        :return: Danh sách product_id đã gộp và loại trùng, theo thứ tự của product_ids rồi theo điểm.
+        """
+        if isinstance(product_type, str) or product_type is None:
+            product_types = [product_type] * len(product_ids)
+        else:
+            product_types = list(product_type)
 
-            candidate_categories = self.indices[product_type]['category'][valid_candidate_indices]
-            category_distances = np.linalg.norm(candidate_categories - query_vector_category, axis=1)
+        # Nhóm các product_id hợp lệ theo loại sản phẩm, bỏ qua các product_id trùng lặp
+        groups = {}
+        seen = set()
+        for position, (pid, ptype) in enumerate(zip(product_ids, product_types)):
+            if pid in seen:
+                continue
+            if ptype is None:
+                ptype = next((t for t in self.row_index if pid in self.row_index[t]), None)
+            row = self.row_index.get(ptype, {}).get(pid)
+            if row is None or ptype not in self.indices:
+                continue
+            seen.add(pid)
+            groups.setdefault(ptype, []).append((position, pid, row))
 
-            candidate_authors = self.indices[product_type]['author'][valid_candidate_indices]
-            author_distances = np.linalg.norm(candidate_authors - query_vector_author, axis=1)
+        excluded_ids = list(viewed_product_ids) if exclude_viewed and viewed_product_ids is not None else []
 
-            candidate_publishers = self.indices[product_type]['publisher'][valid_candidate_indices]
-            publisher_distances = np.linalg.norm(candidate_publishers - query_vector_publisher, axis=1)
+        results = {}
+        for ptype, seeds in groups.items():
+            # Các sản phẩm có trong bảng láng giềng được phục vụ trực tiếp, phần còn lại tìm kiếm theo lô
+            live_seeds = []
+            for position, pid, row in seeds:
+                seed_excluded = excluded_ids + [pid] if exclude_viewed else None
+                table_ids = self._neighbors_from_table(ptype, row, top_k, seed_excluded)
+                if table_ids is None:
+                    live_seeds.append((position, pid, row))
+                else:
+                    results[position] = table_ids
+            if not live_seeds:
+                continue
 
-            total_distances = distances[0][:len(valid_candidate_indices)] + category_distances + author_distances + publisher_distances
-            recommendations = list(zip(candidate_product_ids, total_distances))
+            positions, seed_ids, rows = (np.array(column) for column in zip(*live_seeds))
+            search_field, _ = PRODUCT_FIELDS[ptype]
+            product_data = self.data[ptype]
+            queries = np.asarray(product_data[f'vector_{search_field}'][rows], dtype='float32')
 
-            #recommendations = [rec for rec in recommendations if rec[0] != product_id]
+            # Một lần tìm kiếm FAISS cho tất cả sản phẩm cùng loại
+            distances, candidate_rows = self.indices[ptype][search_field].search(queries, top_k * 3)
+            scores = self._score_candidates(ptype, rows, candidate_rows, distances)
 
-            if exclude_viewed and viewed_product_ids is not None:
-                recommendations = [rec for rec in recommendations if rec[0] not in viewed_product_ids]
+            candidate_ids = product_data['product_id'][np.where(candidate_rows >= 0, candidate_rows, 0)]
             if exclude_viewed:
-                recommendations = [rec for rec in recommendations if rec[0] != product_id]
+                scores[candidate_ids == seed_ids[:, None]] = np.inf
+                if excluded_ids:
+                    scores[np.isin(candidate_ids, excluded_ids)] = np.inf
 
+            order = np.argsort(scores, axis=1, kind='stable')[:, :top_k]
+            top_scores = np.take_along_axis(scores, order, axis=1)
+            top_ids = np.take_along_axis(candidate_ids, order, axis=1)
+            for position, ids, valid in zip(positions, top_ids, np.isfinite(top_scores)):
+                results[position] = ids[valid].tolist()
 
-            recommendations.sort(key=lambda x: x[1])
-            recommended_product_ids = [rec[0] for rec in recommendations[:top_k]]
-
-        else:
-            return []  # Return empty list if the product_type is invalid
-
-        return recommended_product_ids
+        # Gộp kết quả theo thứ tự đầu vào và loại bỏ trùng lặp
+        merged = []
+        for position in sorted(results):
+            merged.extend(results[position])
+        return list(dict.fromkeys(merged))
@@ -1,15 +1,17 @@
 import numpy as np
 import random
-from collections import deque
-from tensorflow.keras.models import Sequential, load_model # type: ignore
+from tensorflow.keras.models import Sequential, load_model, clone_model # type: ignore
 from tensorflow.keras.layers import Dense # type: ignore
 from tensorflow.keras.optimizers import Adam # type: ignore
 from tensorflow.keras.losses import MeanSquaredError # type: ignore
 import os
+from .dqn_inference import publish_weights
+from .replay_buffer import ReplayBuffer, PrioritizedReplayBuffer
 
 # Định nghĩa lớp DeepQNetwork
 class DeepQNetwork:
-    def __init__(self, state_size, action_size, gamma=0.95, learning_rate=0.001, epsilon=1.0, epsilon_decay=0.995, epsilon_min=0.01, batch_size=32):
+    def __init__(self, state_size, action_size, gamma=0.95, learning_rate=0.001, epsilon=1.0, epsilon_decay=0.995, epsilon_min=0.01, batch_size=32, gradient_steps=1,
+                 memory_size=2000, prioritized_replay=False, target_update_interval=100):
         self.state_size = state_size
         self.action_size = action_size
         self.gamma = gamma  # Discount factor
@@ -18,11 +20,31 @@ class DeepQNetwork:
         self.epsilon_decay = epsilon_decay
         self.epsilon_min = epsilon_min
         self.batch_size = batch_size
-        self.memory = deque(maxlen=2000)  # Replay buffer
+        self.gradient_steps = gradient_steps  # Số bước cập nhật gradient cho mỗi lần replay
+        # Replay buffer dạng mảng vòng; tùy chọn lấy mẫu ưu tiên theo TD error
+        if prioritized_replay:
+            self.memory = PrioritizedReplayBuffer(memory_size, state_size)
+        else:
+            self.memory = ReplayBuffer(memory_size, state_size)
 
         # Xây dựng mô hình mạng nơ-ron
         self.model = self.build_model()
 
+        # Mạng mục tiêu dùng để tính giá trị Q của next_state, đồng bộ sau mỗi target_update_interval bước
+        # (None: dùng luôn mạng chính như trước)
+        self.target_update_interval = target_update_interval
+        self.train_steps = 0
+        self.target_model = None
+        self.update_target_model()
+
+    def update_target_model(self):
+        if not self.target_update_interval:
+            self.target_model = self.model
+            return
+        if self.target_model is None or self.target_model is self.model:
+            self.target_model = clone_model(self.model)
+        self.target_model.set_weights(self.model.get_weights())
+
     def build_model(self):
         model = Sequential()
         model.add(Dense(24, input_dim=self.state_size, activation='relu'))
@@ -32,7 +54,7 @@ class DeepQNetwork:
         return model
 
     def remember(self, state, action, reward, next_state, done):
-        self.memory.append((state, action, reward, next_state, done))
+        self.memory.add(state, action, reward, next_state, done)
 
     def act(self, state):
         state = np.reshape(state, [1, self.state_size])  # Đảm bảo state có đúng hình dạng
@@ -41,22 +63,35 @@ class DeepQNetwork:
         act_values = self.model.predict(state)
         return np.argmax(act_values[0])  # Khai thác
 
-    def replay(self):
+    def act_batch(self, states):
+        # Chọn hành động cho nhiều trạng thái với một lần predict
+        states = np.reshape(states, [-1, self.state_size]).astype('float32')
+        actions = np.argmax(np.asarray(self.model.predict_on_batch(states)), axis=1)
+        explore = np.random.rand(len(states)) <= self.epsilon
+        actions[explore] = np.random.randint(self.action_size, size=int(explore.sum()))
+        return actions
+
+    def replay(self, gradient_steps=None):
         if len(self.memory) < self.batch_size:
             return
 
-        minibatch = random.sample(self.memory, self.batch_size)
-        for state, action, reward, next_state, done in minibatch:
-            state = np.reshape(state, [1, self.state_size])
-            next_state = np.reshape(next_state, [1, self.state_size])
-            
-            target = reward
-            if not done:
-                target = reward + self.gamma * np.amax(self.model.predict(next_state)[0])
+        for _ in range(gradient_steps or self.gradient_steps):
+            idx, states, actions, rewards, next_states, dones, weights = self.memory.sample(self.batch_size)
+
+            # Hai lần predict cho cả minibatch thay vì hai lần cho mỗi mẫu
+            next_q_values = np.asarray(self.target_model.predict_on_batch(next_states))
+            targets = rewards + self.gamma * np.amax(next_q_values, axis=1) * ~dones
 
-            target_f = self.model.predict(state)
-            target_f[0][action] = target
-            self.model.fit(state, target_f, epochs=1, verbose=0)
+            target_f = np.array(self.model.predict_on_batch(states))
+            rows = np.arange(self.batch_size)
+            td_errors = targets - target_f[rows, actions]
+            target_f[rows, actions] = targets
+            self.model.train_on_batch(states, target_f, sample_weight=weights)
+            self.memory.update_priorities(idx, td_errors)
+
+            self.train_steps += 1
+            if self.target_update_interval and self.train_steps % self.target_update_interval == 0:
+                self.update_target_model()
 
         if self.epsilon > self.epsilon_min:
             self.epsilon *= self.epsilon_decay
@@ -66,10 +101,19 @@ class DeepQNetwork:
             self.model = load_model(name, custom_objects={'mse': MeanSquaredError()})
             # Tạo lại optimizer sau khi load mô hình
             self.model.compile(loss='mse', optimizer=Adam(learning_rate=self.learning_rate))
+            self.target_model = None
+            self.update_target_model()
             print(f"Mô hình DQN đã được tải từ {name}")
         else:
             print(f"Không tìm thấy mô hình {name}, bắt đầu huấn luyện từ đầu.")
 
     def save(self, name):
-        self.model.save(name)
-        print(f"Mô hình DQN đã được lưu tại {name}")
\ No newline at end of file
+        # Ghi ra tệp tạm rồi đổi tên để không bao giờ để lại tệp .h5 ghi dở
+        base, ext = os.path.splitext(name)
+        tmp_name = f'{base}.tmp{ext}'
+        self.model.save(tmp_name)
+        os.replace(tmp_name, name)
+
+        # Xuất thêm một phiên bản trọng số dạng NumPy để phục vụ suy luận không cần TensorFlow
+        version = publish_weights(self.model, name, self.epsilon)
+        print(f"Mô hình DQN đã được lưu tại {name} (phiên bản {version})")
\ No newline at end of file
@@ -0,0 +1,168 @@
+import glob
+import json
+import os
+import threading
+import time
+import numpy as np
+
+# Các hàm kích hoạt được hỗ trợ trong các lớp Dense
+ACTIVATIONS = {
+    'relu': lambda x: np.maximum(x, 0.0),
+    'linear': lambda x: x,
+}
+
+
+def snapshot_pointer_for(model_path):
+    """Đường dẫn tệp con trỏ tới phiên bản trọng số mới nhất của mô hình Keras (.h5)."""
+    base, _ = os.path.splitext(model_path)
+    return f'{base}.latest.json'
+
+
+def read_snapshot_pointer(pointer_path):
+    """Nội dung tệp con trỏ ({'version', 'path'}), hoặc None nếu chưa có phiên bản nào."""
+    try:
+        with open(pointer_path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def export_weights(model, path, epsilon=0.0):
+    """
+    Xuất trọng số các lớp Dense của mô hình Keras sang tệp .npz để suy luận không cần TensorFlow.
+    Tệp được ghi ra tệp tạm rồi đổi tên, nên bên đọc không bao giờ thấy tệp ghi dở.
+    :param model: Mô hình Keras Sequential gồm các lớp Dense.
+    :param path: Đường dẫn tệp .npz.
+    :param epsilon: Tỷ lệ thám hiểm hiện tại của agent.
+    """
+    arrays = {}
+    activations = []
+    for i, layer in enumerate(model.layers):
+        kernel, bias = layer.get_weights()
+        arrays[f'kernel_{i}'] = kernel.astype('float32')
+        arrays[f'bias_{i}'] = bias.astype('float32')
+        activations.append(layer.get_config()['activation'])
+
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, activations=np.array(activations), epsilon=np.array(epsilon), **arrays)
+    os.replace(tmp_path, path)
+
+
+def publish_weights(model, model_path, epsilon=0.0, keep=3):
+    """
+    Xuất một phiên bản trọng số mới (<model>.v000001.npz, ...) rồi trỏ con trỏ tới nó bằng os.replace.
+    Các tệp phiên bản không bao giờ bị ghi đè, bên đọc luôn thấy một phiên bản hoàn chỉnh.
+    :param keep: Số phiên bản gần nhất được giữ lại trên đĩa.
+    :return: Số phiên bản vừa xuất.
+    """
+    base, _ = os.path.splitext(model_path)
+    pointer_path = snapshot_pointer_for(model_path)
+    pointer = read_snapshot_pointer(pointer_path)
+    version = pointer['version'] + 1 if pointer else 1
+
+    snapshot_path = f'{base}.v{version:06d}.npz'
+    export_weights(model, snapshot_path, epsilon)
+
+    tmp_path = f'{pointer_path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'version': version, 'path': os.path.basename(snapshot_path)}, f)
+    os.replace(tmp_path, pointer_path)
+
+    # Xóa các phiên bản cũ; phiên bản trước vẫn được giữ cho bên đọc đang nạp dở
+    for old_path in glob.glob(f'{base}.v*.npz'):
+        try:
+            old_version = int(old_path[len(base) + 2:-len('.npz')])
+        except ValueError:
+            continue
+        if old_version <= version - keep:
+            os.remove(old_path)
+    return version
+
+
+class NumpyQNetwork:
+    def __init__(self, pointer_path, action_size, check_interval=5.0):
+        """
+        Suy luận DQN bằng NumPy thuần từ phiên bản trọng số mới nhất, tự chuyển sang phiên bản mới khi có.
+        :param pointer_path: Đường dẫn tệp con trỏ do publish_weights cập nhật.
+        :param action_size: Số hành động (dùng khi chưa có trọng số).
+        :param check_interval: Khoảng thời gian tối thiểu (giây) giữa hai lần kiểm tra tệp con trỏ.
+        """
+        self.pointer_path = pointer_path
+        self.action_size = action_size
+        self.check_interval = check_interval
+        # (các lớp, epsilon) của phiên bản trọng số hiện tại
+        self._snapshot = (None, 1.0)
+        self.version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        """Nạp phiên bản trọng số mà con trỏ đang chỉ tới. Trả về True nếu đã chuyển sang phiên bản mới."""
+        pointer = read_snapshot_pointer(self.pointer_path)
+        if pointer is None or pointer['version'] == self.version:
+            return False
+
+        # Nạp phiên bản mới vào bộ đệm dự phòng trong khi các yêu cầu vẫn dùng phiên bản cũ
+        weights_path = os.path.join(os.path.dirname(self.pointer_path), pointer['path'])
+        try:
+            with np.load(weights_path) as weights:
+                activations = [str(a) for a in weights['activations']]
+                layers = tuple(
+                    (weights[f'kernel_{i}'], weights[f'bias_{i}'], ACTIVATIONS[activation])
+                    for i, activation in enumerate(activations)
+                )
+                epsilon = float(weights['epsilon'])
+        except OSError:
+            return False  # Phiên bản vừa bị thay thế và dọn đi, lần kiểm tra sau sẽ nạp phiên bản mới hơn
+
+        # Hoán đổi cả bộ trọng số trong một phép gán, các yêu cầu đang chạy vẫn dùng bộ cũ
+        self._snapshot = (layers, epsilon)
+        self.version = pointer['version']
+        return True
+
+    @property
+    def epsilon(self):
+        return self._snapshot[1]
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        if self._lock.acquire(blocking=False):
+            try:
+                self._checked_at = now
+                self.reload()
+            finally:
+                self._lock.release()
+
+    def _forward(self, layers, states):
+        x = np.asarray(states, dtype='float32').reshape(-1, layers[0][0].shape[0])
+        for kernel, bias, activation in layers:
+            x = activation(x @ kernel + bias)
+        return x
+
+    def predict(self, states):
+        """Giá trị Q cho một hoặc nhiều trạng thái, dạng (n, action_size)."""
+        self._maybe_reload()
+        layers, _ = self._snapshot
+        if layers is None:
+            raise RuntimeError(f"DQN weights not loaded: {self.pointer_path}")
+        return self._forward(layers, states)
+
+    def act_batch(self, states):
+        """Chọn hành động epsilon-greedy cho một lô trạng thái dạng (n, state_size)."""
+        self._maybe_reload()
+        layers, epsilon = self._snapshot
+        states = np.atleast_2d(np.asarray(states, dtype='float32'))
+        if layers is None:
+            return np.random.randint(self.action_size, size=len(states))  # Chưa có mô hình: thám hiểm
+
+        actions = np.argmax(self._forward(layers, states), axis=1)
+        explore = np.random.rand(len(states)) <= epsilon
+        actions[explore] = np.random.randint(self.action_size, size=int(explore.sum()))
+        return actions
+
+    def act(self, state):
+        return int(self.act_batch(np.reshape(state, [1, -1]))[0])
@@ -0,0 +1,182 @@
+import time
+import numpy as np
+from sqlalchemy import String, cast, func, or_
+from db.dbo import UserActivityLog, db
+
+# Phần thưởng cho từng loại hoạt động của người dùng
+ACTIVITY_REWARDS = {
+    'view': 1,
+    'favourite': 3,
+    'select': 2,
+    'remove_from_cart': -1,
+    'search': 0
+}
+
+
+def get_activity_score(activity_type):
+    return ACTIVITY_REWARDS.get(activity_type, 0)
+
+
+class IncrementalDQNTrainer:
+    def __init__(self, agent, state_size, reward_fn=get_activity_score, max_events=10000, max_gradient_steps=50,
+                 activity_types=tuple(ACTIVITY_REWARDS), gap_timeout=600, max_gaps=10000):
+        """
+        Huấn luyện DQN chỉ trên các hoạt động mới kể từ lần huấn luyện trước.
+        :param agent: Đối tượng DeepQNetwork cần huấn luyện.
+        :param state_size: Số product_id gần nhất tạo thành trạng thái của người dùng.
+        :param reward_fn: Hàm ánh xạ activity_type sang phần thưởng.
+        :param max_events: Số hoạt động mới tối đa xử lý trong một chu kỳ.
+        :param max_gradient_steps: Số bước replay tối đa trong một chu kỳ.
+        :param activity_types: Các loại hoạt động được huấn luyện; loại khác (giá trị lạ trong DB) bị bỏ qua.
+        :param gap_timeout: Số giây chờ một activity_id còn trống dưới mốc được commit trước khi bỏ qua hẳn.
+        :param max_gaps: Số activity_id còn trống tối đa được theo dõi.
+        """
+        self.agent = agent
+        self.state_size = state_size
+        self.reward_fn = reward_fn
+        self.max_events = max_events
+        self.max_gradient_steps = max_gradient_steps
+        self.activity_types = set(activity_types)
+        self.gap_timeout = gap_timeout
+        self.max_gaps = max_gaps
+        # Mốc activity_id cao nhất đã được huấn luyện
+        self.last_activity_id = 0
+        # Các activity_id dưới mốc chưa đọc được: nhiều tiến trình web ghi hoạt động theo lô, nên một id nhỏ
+        # có thể được commit sau một id lớn hơn. activity_id -> thời điểm phát hiện (time.time())
+        self.gaps = {}
+
+    def _pad(self, product_ids):
+        state = product_ids[:self.state_size]
+        return state + [0] * (self.state_size - len(state))
+
+    def fetch_new_events(self):
+        """Các hoạt động có activity_id lớn hơn mốc hoặc nằm trong các id còn trống, theo thứ tự, trong một truy vấn."""
+        condition = UserActivityLog.activity_id > self.last_activity_id
+        if self.gaps:
+            condition = or_(condition, UserActivityLog.activity_id.in_(list(self.gaps)))
+        # activity_type được đọc dạng chuỗi: một giá trị Enum không biết (SQLite không kiểm tra) sẽ
+        # làm hỏng cả lô với LookupError
+        return (
+            db.session.query(
+                UserActivityLog.activity_id, UserActivityLog.user_id,
+                UserActivityLog.product_id, cast(UserActivityLog.activity_type, String).label('activity_type')
+            )
+            .filter(condition)
+            .order_by(UserActivityLog.activity_id)
+            .limit(self.max_events)
+            .all()
+        )
+
+    def fetch_histories(self, user_ids, exclude_ids=()):
+        """
+        state_size product_id gần nhất (mới nhất trước) của mỗi người dùng tính đến mốc hiện tại,
+        trừ các hoạt động exclude_ids, lấy bằng một truy vấn cửa sổ.
+        """
+        row_number = func.row_number().over(
+            partition_by=UserActivityLog.user_id,
+            order_by=UserActivityLog.activity_id.desc()
+        ).label('row_number')
+        recent = (
+            db.session.query(
+                UserActivityLog.user_id, UserActivityLog.product_id,
+                UserActivityLog.activity_id, row_number
+            )
+            .filter(
+                UserActivityLog.user_id.in_(user_ids),
+                UserActivityLog.activity_id <= self.last_activity_id,
+                UserActivityLog.activity_id.notin_(exclude_ids)
+            )
+            .subquery()
+        )
+        rows = (
+            db.session.query(recent.c.user_id, recent.c.product_id)
+            .filter(recent.c.row_number <= self.state_size)
+            .order_by(recent.c.user_id, recent.c.activity_id.desc())
+            .all()
+        )
+
+        histories = {user_id: [] for user_id in user_ids}
+        for user_id, product_id in rows:
+            histories[user_id].append(product_id)
+        return histories
+
+    def build_transitions(self, events):
+        """
+        Dựng các chuyển trạng thái (state, reward, next_state) cho mọi hoạt động mới.
+        Mỗi hoạt động đẩy product_id của nó lên đầu lịch sử của người dùng. Hoạt động có loại
+        không thuộc activity_types chỉ cập nhật lịch sử, không tạo chuyển trạng thái.
+        """
+        # Hoạt động lấp chỗ trống dưới mốc đã nằm trong lịch sử đọc từ DB, bỏ ra để không đếm hai lần
+        late_ids = [event.activity_id for event in events if event.activity_id <= self.last_activity_id]
+        histories = self.fetch_histories(list({event.user_id for event in events}), late_ids)
+
+        states, rewards, next_states = [], [], []
+        skipped = 0
+        for event in events:
+            history = histories[event.user_id]
+            if event.activity_type not in self.activity_types:
+                history.insert(0, event.product_id)
+                skipped += 1
+                continue
+            states.append(self._pad(history))
+            history.insert(0, event.product_id)
+            next_states.append(self._pad(history))
+            rewards.append(self.reward_fn(event.activity_type))
+        if skipped:
+            print(f"Bỏ qua {skipped} hoạt động có loại không xác định khi huấn luyện DQN")
+
+        return (
+            np.array(states, dtype='float32'),
+            np.array(rewards, dtype='float32'),
+            np.array(next_states, dtype='float32'),
+        )
+
+    def next_watermark(self, events):
+        """
+        Mốc mới sau các hoạt động đã đọc: activity_id lớn nhất cùng các id còn trống bên dưới để đọc lại sau.
+        Không thay đổi trainer; bên gọi gán lại sau khi đã lưu mô hình.
+        :return: (last_activity_id, gaps)
+        """
+        now = time.time()
+        seen = {event.activity_id for event in events}
+        gaps = {activity_id: found_at for activity_id, found_at in self.gaps.items() if activity_id not in seen}
+
+        highest = max(self.last_activity_id, events[-1].activity_id)
+        start = max(self.last_activity_id + 1, highest - len(events) - self.max_gaps)
+        for activity_id in range(start, highest + 1):
+            if activity_id not in seen:
+                gaps[activity_id] = now
+        return highest, self.expire_gaps(gaps, now)
+
+    def expire_gaps(self, gaps, now=None):
+        # Id còn trống quá lâu là của giao dịch đã rollback, sẽ không bao giờ được commit
+        now = time.time() if now is None else now
+        gaps = {
+            activity_id: found_at for activity_id, found_at in gaps.items()
+            if now - found_at < self.gap_timeout
+        }
+        if len(gaps) > self.max_gaps:
+            gaps = dict(sorted(gaps.items())[-self.max_gaps:])
+        return gaps
+
+    def train_cycle(self):
+        """
+        Một chu kỳ huấn luyện: lấy hoạt động mới, dựng chuyển trạng thái theo lô và huấn luyện.
+        Mốc của trainer không đổi; bên gọi gán mốc trả về sau khi đã lưu mô hình.
+        :return: (Số hoạt động mới đã xử lý, (last_activity_id, gaps) mới).
+        """
+        self.gaps = self.expire_gaps(self.gaps)
+        events = self.fetch_new_events()
+        if not events:
+            return 0, (self.last_activity_id, self.gaps)
+
+        states, rewards, next_states = self.build_transitions(events)
+        if len(states):
+            actions = self.agent.act_batch(states)
+            for state, action, reward, next_state in zip(states, actions, rewards, next_states):
+                self.agent.remember(state.reshape(1, -1), int(action), float(reward), next_state.reshape(1, -1), False)
+
+            gradient_steps = min(self.max_gradient_steps, max(1, len(states) // self.agent.batch_size))
+            self.agent.replay(gradient_steps=gradient_steps)
+
+        return len(events), self.next_watermark(events)
@@ -0,0 +1,187 @@
+import argparse
+import fcntl
+import glob
+import json
+import os
+import sys
+import time
+import traceback
+from flask import Flask
+from config import Config
+from db.dbo import db
+from .dqn import DeepQNetwork
+from .dqn_inference import publish_weights, read_snapshot_pointer, snapshot_pointer_for
+from .dqn_trainer import IncrementalDQNTrainer
+
+
+def state_path_for(model_path):
+    """
+    Đường dẫn tệp trạng thái huấn luyện: checkpoint mô hình cùng mốc activity_id tương ứng,
+    để tiếp tục sau khi khởi động lại.
+    """
+    base, _ = os.path.splitext(model_path)
+    return f'{base}.state.json'
+
+
+def load_state(model_path):
+    """Nội dung tệp trạng thái ({'checkpoint', 'epsilon', 'last_activity_id', 'gaps'}), hoặc None nếu chưa có."""
+    try:
+        with open(state_path_for(model_path), 'r') as f:
+            state = json.load(f)
+        return {
+            'checkpoint': state.get('checkpoint'),
+            'epsilon': state.get('epsilon'),
+            'last_activity_id': int(state['last_activity_id']),
+            'gaps': {int(activity_id): found_at for activity_id, found_at in state.get('gaps', [])},
+        }
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def save_checkpoint(agent, model_path, last_activity_id, gaps, keep=2):
+    """
+    Lưu mô hình và mốc activity_id như một bước nguyên tử: mô hình được ghi ra một tệp checkpoint mới
+    (<model>.ckpt000001.h5, ...), rồi tệp trạng thái trỏ tới nó cùng mốc mới được thay bằng os.replace.
+    Dừng giữa chừng thì tệp trạng thái cũ vẫn trỏ tới checkpoint cũ và mốc cũ.
+    :param keep: Số checkpoint gần nhất được giữ lại trên đĩa.
+    """
+    base, ext = os.path.splitext(model_path)
+    state = load_state(model_path)
+    previous = state['checkpoint'] if state else None
+    version = int(previous[len(os.path.basename(base)) + 5:-len(ext)]) + 1 if previous else 1
+
+    checkpoint_path = f'{base}.ckpt{version:06d}{ext}'
+    tmp_checkpoint_path = f'{base}.ckpt{version:06d}.tmp{ext}'
+    agent.model.save(tmp_checkpoint_path)
+    os.replace(tmp_checkpoint_path, checkpoint_path)
+
+    path = state_path_for(model_path)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({
+            'checkpoint': os.path.basename(checkpoint_path),
+            'epsilon': agent.epsilon,
+            'last_activity_id': last_activity_id,
+            'gaps': list(gaps.items()),
+        }, f)
+    os.replace(tmp_path, path)
+
+    for old_path in glob.glob(f'{base}.ckpt*{ext}'):
+        try:
+            old_version = int(old_path[len(base) + 5:-len(ext)])
+        except ValueError:
+            continue
+        if old_version <= version - keep:
+            os.remove(old_path)
+
+
+def acquire_lock(model_path):
+    """
+    Khóa độc quyền để chỉ một tiến trình huấn luyện chạy cho mỗi mô hình.
+    :return: Tệp khóa (cần giữ mở trong suốt thời gian chạy), hoặc None nếu đã có tiến trình khác giữ khóa.
+    """
+    base, _ = os.path.splitext(model_path)
+    lock_file = open(f'{base}.lock', 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def run(app, state_size, action_size, parent_pid=None, once=False):
+    """
+    Vòng lặp huấn luyện DQN trong tiến trình riêng: huấn luyện trên hoạt động mới,
+    lưu mô hình và xuất một phiên bản trọng số mới cho các tiến trình phục vụ.
+    """
+    model_path = app.config['MODEL_PATH']
+    interval = app.config['MODEL_UPDATE_INTERVAL']
+
+    lock_file = acquire_lock(model_path)
+    if lock_file is None:
+        print(f"Một tiến trình huấn luyện DQN khác đang chạy cho {model_path}, thoát.")
+        return
+
+    def restore():
+        # Agent và trainer dựng lại từ checkpoint đã lưu: trọng số, mốc và bộ nhớ replay (rỗng) khớp nhau
+        agent = DeepQNetwork(
+            state_size=state_size,
+            action_size=action_size,
+            memory_size=app.config.get('DQN_MEMORY_SIZE', 2000),
+            prioritized_replay=app.config.get('DQN_PRIORITIZED_REPLAY', False)
+        )
+        trainer = IncrementalDQNTrainer(agent, state_size)
+        state = load_state(model_path)
+        checkpoint_path = state and state['checkpoint'] and os.path.join(os.path.dirname(model_path), state['checkpoint'])
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            agent.load(checkpoint_path)
+            if state['epsilon'] is not None:
+                agent.epsilon = state['epsilon']
+            trainer.last_activity_id, trainer.gaps = state['last_activity_id'], state['gaps']
+            return agent, trainer, True
+        agent.load(model_path)
+        return agent, trainer, False
+
+    agent, trainer, from_checkpoint = restore()
+
+    # Chưa có phiên bản trọng số nào, hoặc checkpoint có thể mới hơn phiên bản đã xuất (dừng giữa lúc lưu
+    # và lúc xuất): xuất ngay để phục vụ không phải chờ chu kỳ đầu
+    pointer = read_snapshot_pointer(snapshot_pointer_for(model_path))
+    if from_checkpoint or (os.path.exists(model_path) and pointer is None):
+        publish_weights(agent.model, model_path, agent.epsilon)
+
+    with app.app_context():
+        while True:
+            # Tiến trình cha (máy chủ web) đã dừng thì dừng theo
+            if parent_pid is not None and os.getppid() != parent_pid:
+                print("Tiến trình cha đã dừng, dừng huấn luyện DQN.")
+                break
+
+            # Lỗi tạm thời (mất kết nối DB, ghi tệp thất bại) không được dừng tiến trình huấn luyện:
+            # ghi log, hủy giao dịch, quay về checkpoint đã lưu và thử lại ở chu kỳ sau
+            try:
+                trained, (last_activity_id, gaps) = trainer.train_cycle()
+                if trained:
+                    save_checkpoint(agent, model_path, last_activity_id, gaps)
+                    # Mốc trong bộ nhớ chỉ tiến sau khi mô hình và mốc đã cùng được lưu
+                    trainer.last_activity_id, trainer.gaps = last_activity_id, gaps
+                    version = publish_weights(agent.model, model_path, agent.epsilon)
+                    print(f"Mô hình DQN đã được huấn luyện trên {trained} hoạt động mới (phiên bản {version})")
+            except Exception:
+                print("Lỗi trong chu kỳ huấn luyện DQN, quay về checkpoint đã lưu và thử lại ở chu kỳ sau:")
+                traceback.print_exc()
+                db.session.rollback()
+                # Các chuyển trạng thái của chu kỳ lỗi đã vào bộ nhớ replay và trọng số; bỏ chúng đi để
+                # chu kỳ sau (đọc lại cùng các hoạt động) không huấn luyện lặp lại trên chúng
+                agent, trainer, _ = restore()
+
+            # Giải phóng session để chu kỳ sau thấy các hoạt động mới được commit
+            db.session.remove()
+
+            if once:
+                break
+            time.sleep(interval)
+
+    lock_file.close()
+
+
+def create_app():
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    db.init_app(app)
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Huấn luyện DQN trong tiến trình riêng và xuất các phiên bản trọng số.")
+    parser.add_argument('--state-size', type=int, default=10)
+    parser.add_argument('--action-size', type=int, default=50)
+    parser.add_argument('--parent-pid', type=int, default=None, help="Dừng khi tiến trình này kết thúc")
+    parser.add_argument('--once', action='store_true', help="Chỉ chạy một chu kỳ huấn luyện")
+    args = parser.parse_args(argv)
+    run(create_app(), args.state_size, args.action_size, parent_pid=args.parent_pid, once=args.once)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import faiss
+from search_engine.embedding_store import embedding_source_path
+
+
+def neighbor_table_paths(model_path):
+    """
+    Đường dẫn các tệp của bảng láng giềng, nằm cạnh tệp .npy của loại sản phẩm.
+    :param model_path: Đường dẫn đến tệp .npy chứa dữ liệu (ví dụ fashion.npy).
+    :return: (tệp vị trí dòng int32, tệp điểm float16).
+    """
+    base, _ = os.path.splitext(model_path)
+    return f'{base}.neighbors.rows.npy', f'{base}.neighbors.scores.npy'
+
+
+def load_neighbor_table(model_path, n_rows):
+    """
+    Nạp bảng láng giềng dưới dạng memory-map nếu có và còn khớp với dữ liệu.
+    :param model_path: Đường dẫn đến tệp .npy chứa dữ liệu.
+    :param n_rows: Số sản phẩm trong dữ liệu hiện tại.
+    :return: (rows, scores) hoặc None nếu bảng không tồn tại hoặc đã cũ.
+    """
+    rows_path, scores_path = neighbor_table_paths(model_path)
+    if not (os.path.exists(rows_path) and os.path.exists(scores_path)):
+        return None
+
+    # Bảng được xây từ phiên bản dữ liệu cũ hơn thì không dùng được nữa
+    if os.path.getmtime(rows_path) < os.path.getmtime(embedding_source_path(model_path)):
+        print(f"Bảng láng giềng {rows_path} cũ hơn {model_path}, bỏ qua.")
+        return None
+
+    rows = np.load(rows_path, mmap_mode='r')
+    scores = np.load(scores_path, mmap_mode='r')
+    if rows.shape[0] != n_rows or rows.shape != scores.shape:
+        print(f"Bảng láng giềng {rows_path} không khớp với dữ liệu, bỏ qua.")
+        return None
+    return rows, scores
+
+
+def build_neighbor_table(dcbf, product_type, model_path, top_k=50, chunk_size=1024, n_jobs=4):
+    """
+    Tính trước top_k láng giềng (theo điểm tổng hợp) cho mọi sản phẩm của một loại và ghi ra đĩa.
+    Các khối truy vấn được tìm kiếm song song bằng FAISS.
+    :param dcbf: Đối tượng DeepContentBasedFiltering đã nạp dữ liệu.
+    :param product_type: Loại sản phẩm ('fashion' hoặc 'book').
+    :param model_path: Đường dẫn đến tệp .npy của loại sản phẩm (bảng được lưu bên cạnh).
+    :param top_k: Số láng giềng lưu cho mỗi sản phẩm.
+    :param chunk_size: Số sản phẩm trong mỗi khối truy vấn.
+    :param n_jobs: Số luồng tìm kiếm song song.
+    :return: Số sản phẩm đã xử lý.
+    """
+    from .dcbf import PRODUCT_FIELDS
+
+    search_field, _ = PRODUCT_FIELDS[product_type]
+    index = dcbf.indices[product_type][search_field]
+    vectors = dcbf.data[product_type][f'vector_{search_field}']
+    n_rows = len(dcbf.data[product_type]['product_id'])
+    top_k = min(top_k, n_rows)
+
+    rows_path, scores_path = neighbor_table_paths(model_path)
+    rows_out = np.lib.format.open_memmap(f'{rows_path}.tmp', mode='w+', dtype=np.int32, shape=(n_rows, top_k))
+    scores_out = np.lib.format.open_memmap(f'{scores_path}.tmp', mode='w+', dtype=np.float16, shape=(n_rows, top_k))
+
+    def process(start):
+        # Mỗi luồng tự tìm kiếm một khối, nên tắt đa luồng OpenMP bên trong FAISS để tránh tranh chấp CPU.
+        # Số luồng OpenMP được đặt riêng cho từng luồng, nên phải đặt trong chính luồng làm việc
+        if n_jobs > 1:
+            faiss.omp_set_num_threads(1)
+        query_rows = np.arange(start, min(start + chunk_size, n_rows))
+        queries = np.asarray(vectors[query_rows], dtype='float32')
+        distances, candidate_rows = index.search(queries, top_k * 3)
+        scores = dcbf._score_candidates(product_type, query_rows, candidate_rows, distances)
+
+        order = np.argsort(scores, axis=1, kind='stable')[:, :top_k]
+        top_scores = np.take_along_axis(scores, order, axis=1)
+        top_rows = np.take_along_axis(candidate_rows, order, axis=1)
+        invalid = ~np.isfinite(top_scores)
+        top_rows[invalid] = -1
+        # Thứ tự đã nằm trong bảng; điểm chỉ để tham khảo nên được chặn trong miền float16
+        top_scores[invalid] = np.inf
+        np.minimum(top_scores, np.finfo(np.float16).max, out=top_scores, where=~invalid)
+
+        rows_out[query_rows] = top_rows
+        scores_out[query_rows] = top_scores
+        return len(query_rows)
+
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        processed = sum(executor.map(process, range(0, n_rows, chunk_size)))
+
+    rows_out.flush()
+    scores_out.flush()
+    del rows_out, scores_out
+    os.replace(f'{scores_path}.tmp', scores_path)
+    os.replace(f'{rows_path}.tmp', rows_path)
+    return processed
+
+
+def main():
+    from .dcbf import DeepContentBasedFiltering
+
+    parser = argparse.ArgumentParser(description="Tính trước bảng top-K láng giềng cho lọc nội dung.")
+    parser.add_argument('config', nargs='?', default='model.json', help="Đường dẫn đến model.json")
+    parser.add_argument('--top-k', type=int, default=50)
+    parser.add_argument('--chunk-size', type=int, default=1024)
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--types', nargs='*', default=None, help="Loại sản phẩm cần xây (mặc định: tất cả)")
+    args = parser.parse_args()
+
+    dcbf = DeepContentBasedFiltering(args.config, use_neighbor_table=False)
+    for product_type, model_path in dcbf.model_paths.items():
+        if args.types and product_type not in args.types:
+            continue
+        start = time.perf_counter()
+        processed = build_neighbor_table(
+            dcbf, product_type, model_path,
+            top_k=args.top_k, chunk_size=args.chunk_size, n_jobs=args.jobs
+        )
+        elapsed = time.perf_counter() - start
+        print(f"{product_type}: {processed} sản phẩm, {elapsed:.1f}s ({processed / max(elapsed, 1e-9):.0f} sản phẩm/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+import numpy as np
+
+
+class ReplayBuffer:
+    def __init__(self, capacity, state_size):
+        """
+        Bộ nhớ replay dạng vòng, cấp phát trước thành các mảng NumPy liên tục.
+        Bộ nhớ sử dụng cố định: capacity * (2 * state_size * 4 + 9) byte.
+        :param capacity: Số chuyển trạng thái tối đa; khi đầy, mẫu cũ nhất bị ghi đè.
+        :param state_size: Kích thước vector trạng thái.
+        """
+        self.capacity = capacity
+        self.state_size = state_size
+        self.states = np.zeros((capacity, state_size), dtype=np.float32)
+        self.actions = np.zeros(capacity, dtype=np.int32)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.next_states = np.zeros((capacity, state_size), dtype=np.float32)
+        self.dones = np.zeros(capacity, dtype=bool)
+        self.position = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, state, action, reward, next_state, done):
+        idx = self.position
+        self.states[idx] = np.reshape(state, -1)
+        self.actions[idx] = action
+        self.rewards[idx] = reward
+        self.next_states[idx] = np.reshape(next_state, -1)
+        self.dones[idx] = done
+        self.position = (self.position + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        return idx
+
+    def _gather(self, idx, weights):
+        return idx, self.states[idx], self.actions[idx], self.rewards[idx], self.next_states[idx], self.dones[idx], weights
+
+    def sample(self, batch_size):
+        """
+        Lấy ngẫu nhiên đều batch_size chuyển trạng thái.
+        :return: (idx, states, actions, rewards, next_states, dones, weights).
+        """
+        idx = np.random.randint(0, self.size, size=batch_size)
+        return self._gather(idx, np.ones(batch_size, dtype=np.float32))
+
+    def update_priorities(self, idx, td_errors):
+        pass  # Lấy mẫu đều không dùng độ ưu tiên
+
+
+class SumTree:
+    def __init__(self, capacity):
+        """
+        Cây tổng nhị phân đầy đủ lưu trong một mảng: lá là độ ưu tiên, nút trong là tổng của hai con.
+        Cập nhật và tìm kiếm đều O(log n).
+        :param capacity: Số lá cần dùng (được làm tròn lên lũy thừa của 2).
+        """
+        self.leaf_count = 1 << max(0, int(capacity - 1).bit_length())
+        self.depth = self.leaf_count.bit_length() - 1
+        self.tree = np.zeros(2 * self.leaf_count - 1, dtype=np.float64)
+
+    def total(self):
+        return self.tree[0]
+
+    def get(self, idx):
+        return self.tree[np.asarray(idx) + self.leaf_count - 1]
+
+    def update(self, idx, priorities):
+        nodes = np.atleast_1d(np.asarray(idx) + self.leaf_count - 1)
+        priorities = np.broadcast_to(np.asarray(priorities, dtype=np.float64), nodes.shape)
+        for node, priority in zip(nodes, priorities):
+            change = priority - self.tree[node]
+            self.tree[node] = priority
+            while node > 0:
+                node = (node - 1) // 2
+                self.tree[node] += change
+
+    def find(self, values):
+        """Vị trí lá ứng với mỗi giá trị tích lũy trong [0, total), tìm cho cả mảng cùng lúc."""
+        values = np.array(values, dtype=np.float64)
+        nodes = np.zeros(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * nodes + 1
+            go_right = values >= self.tree[left]
+            values = np.where(go_right, values - self.tree[left], values)
+            nodes = left + go_right
+        return nodes - (self.leaf_count - 1)
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    def __init__(self, capacity, state_size, alpha=0.6, beta=0.4, beta_increment=0.001, epsilon=1e-6):
+        """
+        Bộ nhớ replay ưu tiên (PER): lấy mẫu theo |TD error|^alpha bằng SumTree,
+        kèm trọng số importance sampling với beta tăng dần tới 1.
+        """
+        super().__init__(capacity, state_size)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.epsilon = epsilon
+        self.max_priority = 1.0
+        self.tree = SumTree(capacity)
+
+    def add(self, state, action, reward, next_state, done):
+        # Mẫu mới nhận độ ưu tiên lớn nhất để chắc chắn được học ít nhất một lần
+        idx = super().add(state, action, reward, next_state, done)
+        self.tree.update(idx, self.max_priority ** self.alpha)
+        return idx
+
+    def sample(self, batch_size):
+        total = self.tree.total()
+        segment = total / batch_size
+        values = (np.arange(batch_size) + np.random.rand(batch_size)) * segment
+        idx = np.minimum(self.tree.find(np.minimum(values, np.nextafter(total, 0))), self.size - 1)
+
+        probabilities = self.tree.get(idx) / total
+        weights = (self.size * np.maximum(probabilities, 1e-12)) ** -self.beta
+        weights = (weights / weights.max()).astype(np.float32)
+        self.beta = min(1.0, self.beta + self.beta_increment)
+        return self._gather(idx, weights)
+
+    def update_priorities(self, idx, td_errors):
+        priorities = np.abs(td_errors) + self.epsilon
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+        self.tree.update(idx, priorities ** self.alpha)
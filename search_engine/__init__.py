@@ -1,2 +1,15 @@
-from .image_search import ImageSearch
-from .text_search import TextSearch
\ No newline at end of file
+import importlib
+
+# Submodules are imported on first access, so importing the lightweight text search
+# helpers does not pull in TensorFlow through ImageSearch
+_EXPORTS = {
+    'ImageSearch': '.image_search',
+    'TextIndexUpdater': '.index_updater',
+    'TextSearch': '.text_search',
+}
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(_EXPORTS[name], __name__), name)
@@ -0,0 +1,132 @@
+import argparse
+import json
+import os
+import shutil
+import time
+import numpy as np
+
+FORMAT_VERSION = 1
+# Keys of the pickled dicts that hold ids: 'index' for images.npy, 'product_id' for fashion/book.npy
+ID_FIELDS = ('product_id', 'index')
+
+
+def embeddings_dir_for(npy_path):
+    """Directory of the columnar store converted from a pickled .npy dict."""
+    base, _ = os.path.splitext(npy_path)
+    return f'{base}.embeddings'
+
+
+def _meta_path(npy_path):
+    return os.path.join(embeddings_dir_for(npy_path), 'meta.json')
+
+
+def has_embeddings(npy_path):
+    """True when a converted store exists and is not older than the .npy it came from."""
+    meta_path = _meta_path(npy_path)
+    if not os.path.exists(meta_path):
+        return False
+    return not os.path.exists(npy_path) or os.path.getmtime(meta_path) >= os.path.getmtime(npy_path)
+
+
+def embedding_source_path(npy_path):
+    """The file the embeddings are actually read from, for staleness checks of derived indexes."""
+    return _meta_path(npy_path) if has_embeddings(npy_path) else npy_path
+
+
+def convert_embeddings(npy_path):
+    """
+    Convert a pickled {id_field: [...], 'vector...': [...]} .npy dict into a columnar store:
+    one contiguous float32 (n, d) .npy per vector field, the ids as int64 (or str) and meta.json.
+    Rows are copied one at a time into memory-mapped output files to keep peak memory low.
+    """
+    data = np.load(npy_path, allow_pickle=True).item()
+    id_field = next(field for field in ID_FIELDS if field in data)
+    vector_fields = [key for key in data if key.startswith('vector')]
+
+    ids = np.asarray(data[id_field])
+    try:
+        ids = ids.astype(np.int64)
+    except (TypeError, ValueError):
+        ids = ids.astype(str)
+
+    out_dir = embeddings_dir_for(npy_path)
+    tmp_dir = f'{out_dir}.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    np.save(os.path.join(tmp_dir, 'ids.npy'), ids)
+    fields = {}
+    for field in vector_fields:
+        rows = data[field]
+        dim = np.asarray(rows[0]).size if len(rows) else 0
+        out = np.lib.format.open_memmap(
+            os.path.join(tmp_dir, f'{field}.npy'), mode='w+', dtype=np.float32, shape=(len(rows), dim)
+        )
+        for i, row in enumerate(rows):
+            out[i] = np.asarray(row, dtype=np.float32).reshape(-1)
+        out.flush()
+        del out
+        fields[field] = [len(rows), dim]
+
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+        json.dump({'format': FORMAT_VERSION, 'count': len(ids), 'id_field': id_field, 'fields': fields}, f)
+
+    # meta.json marks a complete store; swap the directory in only once everything is written
+    old_dir = f'{out_dir}.old'
+    if os.path.exists(out_dir):
+        os.replace(out_dir, old_dir)
+    os.replace(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return out_dir
+
+
+def load_embeddings(npy_path, fields=None):
+    """
+    Load embeddings as a dict shaped like the pickled .npy: the id field maps to an id array
+    and every vector field to a read-only (n, d) float32 memory map shared through the page cache.
+    Falls back to unpickling the .npy when no up-to-date converted store exists.
+    """
+    if not has_embeddings(npy_path):
+        if not os.path.exists(npy_path):
+            raise FileNotFoundError(f"Embeddings not found: {npy_path}")
+        print(f"No columnar store for {npy_path}, loading the pickled file "
+              f"(convert with: python -m search_engine.embedding_store {npy_path})")
+        data = np.load(npy_path, allow_pickle=True).item()
+        for key in list(data):
+            if key.startswith('vector') and (fields is None or key in fields):
+                data[key] = np.vstack(data[key]).astype('float32')
+        return data
+
+    store_dir = embeddings_dir_for(npy_path)
+    with open(os.path.join(store_dir, 'meta.json'), 'r') as f:
+        meta = json.load(f)
+    if meta.get('format') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported embedding store format in {store_dir}: {meta.get('format')}")
+
+    data = {meta['id_field']: np.load(os.path.join(store_dir, 'ids.npy'))}
+    for field in meta['fields']:
+        if fields is None or field in fields:
+            data[field] = np.load(os.path.join(store_dir, f'{field}.npy'), mmap_mode='r')
+    return data
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert pickled embedding .npy dicts to memory-mappable columnar stores.")
+    parser.add_argument('paths', nargs='*', help=".npy files to convert (default: every embedding file in model.json)")
+    parser.add_argument('--config', default='model.json')
+    args = parser.parse_args(argv)
+
+    paths = args.paths
+    if not paths:
+        with open(args.config, 'r') as f:
+            config = json.load(f)
+        paths = [config[key] for key in ('images_vector', 'fashion', 'book') if key in config]
+
+    for path in paths:
+        start = time.perf_counter()
+        out_dir = convert_embeddings(path)
+        print(f"{path} -> {out_dir} ({time.perf_counter() - start:.1f}s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,50 @@
 import json
 import numpy as np
-import faiss
 from tensorflow.keras.preprocessing import image  # type: ignore
 from tensorflow.keras.applications.vgg16 import VGG16, preprocess_input  # type: ignore
 from tensorflow.keras.models import Model  # type: ignore
+from .batching import MicroBatcher
+from .embedding_store import embedding_source_path, load_embeddings
+from .vector_index import (
+    INDEX_TYPES, build_params_from_config, index_path_for, index_tag, load_or_build_index,
+    set_search_params, evaluate_recall
+)
 
 class ImageSearch:
-    def __init__(self, config_file_path):
+    def __init__(self, config_file_path, index_type=None, nprobe=None, ef_search=None, rebuild_index=False):
         with open(config_file_path, 'r') as config_file:
             config = json.load(config_file)
 
         self.model_weights_path = config['vgg16_weights']
         self.vectors_file_path = config['images_vector']
 
+        # Optional "images_index" section: {"type": "flat" | "ivf" | "hnsw" | "sq8" | "pq" | "ivf_sq8" | "ivf_pq",
+        # "nlist", "nprobe", "M", "efConstruction", "efSearch", "pqM", "pqBits", "pretransform": "opq" | "pca", "pcaDim"}
+        index_config = config.get('images_index', {})
+        self.index_type = index_type or index_config.get('type', 'flat')
+        if self.index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type: {self.index_type}")
+        self.build_params = build_params_from_config(index_config)
+        self.nprobe = nprobe if nprobe is not None else index_config.get('nprobe', 8)
+        self.ef_search = ef_search if ef_search is not None else index_config.get('efSearch', 64)
+
         self.model = self._load_feature_extractor()
         self.image_ids, self.image_vectors = self._load_image_features()
+        # Index files are named after their build parameters, so changing them builds a new file
+        self.index_path = index_config.get('path') or index_path_for(
+            self.vectors_file_path, self.index_type,
+            index_tag(self.index_type, self.image_vectors.shape[1], len(self.image_vectors), **self.build_params)
+        )
+        self.index = self._load_index(rebuild_index)
+
+        # Concurrent extract_image_features calls are grouped into one predict per batch
+        batching_config = config.get('images_batching', {})
+        self.batcher = MicroBatcher(
+            self._predict_batch,
+            max_batch_size=batching_config.get('max_batch_size', 16),
+            max_wait_ms=batching_config.get('max_wait_ms', 5),
+            name='vgg16-batcher'
+        )
 
     def _load_feature_extractor(self):
         base_model = VGG16(weights=self.model_weights_path)
@@ -22,27 +52,63 @@ class ImageSearch:
         return model
 
     def _load_image_features(self):
-        data = np.load(self.vectors_file_path, allow_pickle=True).item()
-        image_ids = data['index']
-        image_vectors = np.array(data['vector'])
-        return image_ids, image_vectors
+        # Memory-mapped from the columnar store when converted, so worker processes share one copy
+        data = load_embeddings(self.vectors_file_path)
+        return np.asarray(data['index']), data['vector']
 
-    def extract_image_features(self, img_path):
+    def _load_index(self, rebuild=False):
+        index, built = load_or_build_index(
+            self.image_vectors, self.index_path, self.index_type,
+            rebuild=rebuild, source_path=embedding_source_path(self.vectors_file_path), **self.build_params
+        )
+        set_search_params(index, nprobe=self.nprobe, ef_search=self.ef_search)
+        if built:
+            print(f"Image index ({self.index_type}) built and saved at {self.index_path}")
+            if self.index_type != 'flat':
+                report = self.index_recall(index=index)
+                print(f"Image index ({self.index_type}) recall@{report['k']}: {report['recall']:.3f}")
+        return index
+
+    def index_recall(self, k=10, n_queries=100, index=None):
+        """Recall@k of the configured index against the exact IndexFlatL2 baseline."""
+        report = evaluate_recall(index or self.index, self.image_vectors, k=k, n_queries=n_queries)
+        report['index_type'] = self.index_type
+        return report
+
+    def _load_image_array(self, img_path):
         img = image.load_img(img_path, target_size=(224, 224))
         img_array = image.img_to_array(img)
-        img_array = np.expand_dims(img_array, axis=0)
-        img_array = preprocess_input(img_array)
-        feature_vector = self.model.predict(img_array)
+        return preprocess_input(img_array)
+
+    def _predict_batch(self, img_arrays):
+        feature_vectors = self.model.predict_on_batch(np.stack(img_arrays))
+        return list(np.asarray(feature_vectors, dtype='float32'))
+
+    def extract_image_features(self, img_path):
+        # Decoding happens in the caller's thread; only the predict call is batched
+        feature_vector = self.batcher(self._load_image_array(img_path))
         return feature_vector.flatten()
 
-    def upload_and_search(self, img_path, top_k=48):
-        vector_dim = self.image_vectors.shape[1]
-        index = faiss.IndexFlatL2(vector_dim)
-        index.add(self.image_vectors)
+    def extract_image_features_many(self, img_paths):
+        # Submitted through the batcher like single images, so predict batches stay within
+        # max_batch_size and never run concurrently with other callers
+        futures = [self.batcher.submit(self._load_image_array(img_path)) for img_path in img_paths]
+        return np.vstack([future.result() for future in futures])
 
+    def upload_and_search(self, img_path, top_k=48):
         search_vector = self.extract_image_features(img_path)
-        search_vector = np.expand_dims(search_vector, axis=0)
+        search_vector = np.expand_dims(search_vector, axis=0).astype('float32')
+
+        distances, indices = self.index.search(search_vector, k=top_k)
+        return self._ids_for(indices[0])
+
+    def search_many(self, img_paths, top_k=48):
+        if not img_paths:
+            return []
+        search_vectors = self.extract_image_features_many(img_paths)
+        distances, indices = self.index.search(search_vectors, k=top_k)
+        return [self._ids_for(row) for row in indices]
 
-        distances, indices = index.search(search_vector, k=top_k)
-        similar_image_ids = [self.image_ids[i] for i in indices[0]]
-        return similar_image_ids
\ No newline at end of file
+    def _ids_for(self, rows):
+        # Plain Python ids: NumPy integers cannot be bound as query parameters by psycopg2
+        return self.image_ids[rows[rows >= 0]].tolist()
@@ -0,0 +1,101 @@
+import atexit
+import threading
+import traceback
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from db.dbo import Product, ProductAuthor, ProductCategory
+
+_PENDING_KEY = 'text_index_pending'
+
+
+class TextIndexUpdater:
+    """Keep the Whoosh index in sync with product changes committed through the ORM.
+
+    Session events collect the ids of inserted, updated and deleted products
+    (including changes to their author and category links) and hand them over
+    once the transaction commits. A background thread re-indexes them in
+    batches with `TextSearch.sync_products`, so requests never wait on the
+    index writer. Author or category renames are not tracked.
+    """
+
+    def __init__(self, text_search, app, flush_interval=1.0):
+        self.text_search = text_search
+        self.app = app
+        self.flush_interval = flush_interval
+        self._pending = set()
+        self._cond = threading.Condition()
+        self._closed = False
+
+        event.listen(Session, 'after_flush', self._after_flush)
+        event.listen(Session, 'after_commit', self._after_commit)
+        event.listen(Session, 'after_soft_rollback', self._after_rollback)
+
+        self._thread = threading.Thread(target=self._run, name='text-index-updater', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _after_flush(self, session, flush_context):
+        product_ids = set()
+        for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+            if isinstance(instance, (Product, ProductAuthor, ProductCategory)) and instance.product_id is not None:
+                product_ids.add(instance.product_id)
+        if product_ids:
+            session.info.setdefault(_PENDING_KEY, set()).update(product_ids)
+
+    def _after_commit(self, session):
+        product_ids = session.info.pop(_PENDING_KEY, None)
+        if product_ids:
+            self.submit(product_ids)
+
+    def _after_rollback(self, session, previous_transaction):
+        session.info.pop(_PENDING_KEY, None)
+
+    def submit(self, product_ids):
+        with self._cond:
+            self._pending.update(product_ids)
+            self._cond.notify()
+
+    def flush(self):
+        """Re-index everything submitted so far in the calling thread."""
+        with self._cond:
+            product_ids, self._pending = self._pending, set()
+        self._sync(product_ids)
+
+    def _sync(self, product_ids):
+        if not product_ids:
+            return
+        try:
+            with self.app.app_context():
+                self.text_search.sync_products(product_ids)
+        except Exception:
+            traceback.print_exc()
+            # Keep the ids so the next round retries them
+            with self._cond:
+                self._pending.update(product_ids)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                # Wait a little so bursts of commits are indexed in one writer session
+                self._cond.wait(self.flush_interval)
+                product_ids, self._pending = self._pending, set()
+            self._sync(product_ids)
+
+    def close(self, timeout=10.0):
+        if self._closed:
+            return
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        with self._cond:
+            product_ids, self._pending = self._pending, set()
+        try:
+            with self.app.app_context():
+                self.text_search.sync_products(product_ids)
+        except Exception:
+            traceback.print_exc()
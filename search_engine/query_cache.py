@@ -0,0 +1,205 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Whoosh query operators (and the TO of range queries) are case-sensitive, so they are kept as typed
+QUERY_OPERATORS = {'AND', 'OR', 'NOT', 'ANDNOT', 'ANDMAYBE', 'TO'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS query_cache (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_query_cache_used_at ON query_cache (used_at);
+"""
+
+
+def normalize_query(query_str):
+    return ' '.join(
+        term if term in QUERY_OPERATORS else term.lower()
+        for term in query_str.split()
+    )
+
+
+class MemoryCacheStore:
+    """LRU + TTL store local to this process."""
+
+    def __init__(self, max_entries=1000, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCacheStore:
+    """LRU + TTL store in a local SQLite file, shared by every worker process on the host.
+
+    Hits only read; their last-use times are buffered and written in one
+    batch every `touch_interval` seconds or with the next put, so reads do
+    not queue up on the SQLite write lock.
+    """
+
+    def __init__(self, path, max_entries=10000, ttl=300, touch_interval=5.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.touch_interval = touch_interval
+        self._local = threading.local()
+        self._touch_lock = threading.Lock()
+        self._touched = {}
+        self._touched_since = time.monotonic()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        # sqlite3 connections cannot be shared between threads, so keep one per thread
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._connection()
+        now = time.time()
+        row = conn.execute(
+            'SELECT value FROM query_cache WHERE key = ? AND expires_at > ?', (key, now)
+        ).fetchone()
+        if row is None:
+            return None
+        with self._touch_lock:
+            self._touched[key] = now
+            due = time.monotonic() - self._touched_since >= self.touch_interval
+        if due:
+            with conn:
+                self._write_touches(conn)
+        return json.loads(row[0])
+
+    def _write_touches(self, conn):
+        with self._touch_lock:
+            touched, self._touched = self._touched, {}
+            self._touched_since = time.monotonic()
+        if touched:
+            conn.executemany(
+                'UPDATE query_cache SET used_at = ? WHERE key = ?',
+                [(used_at, key) for key, used_at in touched.items()]
+            )
+
+    def put(self, key, value):
+        conn = self._connection()
+        now = time.time()
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO query_cache (key, value, expires_at, used_at) VALUES (?, ?, ?, ?)',
+                (key, json.dumps(value), now + self.ttl, now)
+            )
+            # Pending last-use times go first so the LRU eviction below sees them
+            self._write_touches(conn)
+            # Drop expired entries, then the least recently used ones above max_entries
+            conn.execute('DELETE FROM query_cache WHERE expires_at <= ?', (now,))
+            conn.execute(
+                'DELETE FROM query_cache WHERE key IN ('
+                'SELECT key FROM query_cache ORDER BY used_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+
+    def clear(self):
+        conn = self._connection()
+        with conn:
+            conn.execute('DELETE FROM query_cache')
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM query_cache').fetchone()[0]
+
+
+class QueryCache:
+    """Cache of text search results keyed on the index generation, normalized query and page.
+
+    A commit to the index creates a new generation, so results cached for an
+    older generation are never returned again; the memory store is cleared as
+    soon as a new generation is seen, the shared store lets them expire.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self._generation = None
+        self._lock = threading.Lock()
+
+    def _key(self, generation, query_str, *args):
+        return json.dumps([generation, normalize_query(query_str)] + list(args))
+
+    def get(self, generation, query_str, *args):
+        if generation != self._generation:
+            with self._lock:
+                if generation != self._generation:
+                    self._generation = generation
+                    if isinstance(self.store, MemoryCacheStore):
+                        self.store.clear()
+        value = self.store.get(self._key(generation, query_str, *args))
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def put(self, generation, query_str, *args, value):
+        self.store.put(self._key(generation, query_str, *args), value)
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'size': len(self.store),
+        }
+
+
+def create_query_cache(backend, max_entries=1000, ttl=300, path=None):
+    """QueryCache for backend 'memory' or 'sqlite', or None when backend is empty."""
+    if not backend:
+        return None
+    if backend == 'memory':
+        return QueryCache(MemoryCacheStore(max_entries, ttl))
+    if backend == 'sqlite':
+        return QueryCache(SQLiteCacheStore(path or 'query_cache.db', max_entries, ttl))
+    raise ValueError(f"Unknown query cache backend: {backend}")
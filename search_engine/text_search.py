@@ -1,55 +1,260 @@
+import argparse
 import os
-from whoosh.index import create_in, open_dir
+import threading
+import time
+from whoosh import writing
+from whoosh.index import create_in, exists_in, open_dir
 from whoosh.qparser import MultifieldParser
+from sqlalchemy.orm import selectinload
 from db.dbo import Product
 from .schema import get_schema
 
+SEARCH_FIELDS = ["name", "description", "authors", "category"]
+
+
+def product_document(product):
+    authors = ", ".join([a.author_name for a in product.authors]) if product.authors else ''
+    categories = ", ".join([c.category_name for c in product.categories]) if product.categories else ''
+    return dict(
+        product_id=str(product.product_id),
+        name=product.product_name,
+        description=product.product_description or '',
+        authors=authors,
+        category=categories
+    )
+
+
 class TextSearch:
-    def __init__(self, index_dir="indexdir"):
+    def __init__(self, index_dir="indexdir", refresh_interval=5.0, writer_timeout=10.0, index_procs=1, index_limitmb=128,
+                 cache=None):
         self.index_dir = index_dir
         if not os.path.exists(self.index_dir):
             os.mkdir(self.index_dir)
         self.schema = get_schema()
+        # Commits from other processes are picked up at most every refresh_interval seconds
+        self.refresh_interval = refresh_interval
+        self.writer_timeout = writer_timeout
+        # Writer processes and memory limit (MB per process) used for full index builds
+        self.index_procs = index_procs
+        self.index_limitmb = index_limitmb
+        # Optional QueryCache, keyed on the generation of the searcher that would answer the query
+        self.cache = cache
+
+        self._lock = threading.Lock()
+        self._ix = None
+        self._parser = None
+        # One searcher shared by all requests; a replaced searcher is closed once its last search ends
+        self._searcher = None
+        self._leases = {}
+        self._stale = False
+        self._checked_at = 0.0
+
+    @property
+    def index(self):
+        if self._ix is None:
+            if not exists_in(self.index_dir):
+                self.create_index()
+            self._ix = open_dir(self.index_dir)
+            self._parser = MultifieldParser(SEARCH_FIELDS, self._ix.schema)
+        return self._ix
+
+    def iter_documents(self, batch_size=1000):
+        # Products are streamed batch_size at a time; authors and categories are loaded
+        # with one extra query per batch instead of two per product
+        query = (
+            Product.query
+            .options(selectinload(Product.authors), selectinload(Product.categories))
+            .order_by(Product.product_id)
+            .yield_per(batch_size)
+        )
+        for product in query:
+            yield product_document(product)
 
-    def create_index(self):
-        if not os.path.exists(os.path.join(self.index_dir, "MAIN")):
+    def create_index(self, rebuild=False, procs=None, limitmb=None, batch_size=1000, progress_every=10000):
+        if exists_in(self.index_dir) and not rebuild:
+            return 0
+        procs = procs or self.index_procs
+        limitmb = limitmb or self.index_limitmb
+
+        mergetype = None
+        ix = open_dir(self.index_dir) if exists_in(self.index_dir) else None
+        if ix is not None and ix.schema == self.schema:
+            # Rebuild in place: the old documents stay searchable until the commit drops them all,
+            # and a failed build leaves them untouched
+            mergetype = writing.CLEAR
+        else:
+            # New index, or a schema change, which needs a fresh index
             ix = create_in(self.index_dir, self.schema)
-            writer = ix.writer()
+        # With several processes each one writes its own segment, merged at commit
+        writer = ix.writer(procs=procs, limitmb=limitmb, multisegment=procs > 1, timeout=self.writer_timeout)
+        started = time.perf_counter()
+        count = 0
+        try:
+            for document in self.iter_documents(batch_size):
+                writer.add_document(**document)
+                count += 1
+                if count % progress_every == 0:
+                    elapsed = time.perf_counter() - started
+                    print(f"Indexed {count} products ({count / elapsed:.0f} docs/s)")
+        except Exception:
+            writer.cancel()
+            raise
+        writer.commit(mergetype=mergetype)
+
+        elapsed = time.perf_counter() - started
+        print(f"Text index built: {count} products in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.0f} docs/s)")
+
+        # Searches started before the rebuild finish on the old searcher
+        with self._lock:
+            if self._searcher is not None:
+                old_searcher, self._searcher = self._searcher, None
+                self._retire(old_searcher)
+            self._ix = None
+        return count
+
+    def _acquire_searcher(self):
+        index = self.index
+        with self._lock:
+            now = time.monotonic()
+            if self._searcher is None:
+                self._searcher = index.searcher()
+                self._checked_at = now
+            elif self._stale or now - self._checked_at >= self.refresh_interval:
+                self._stale = False
+                self._checked_at = now
+                old_searcher = self._searcher
+                if not old_searcher.up_to_date():
+                    if self._leases.get(id(old_searcher)):
+                        # Searches are still running on the old segments: open a new searcher
+                        # and close the old one when they finish
+                        self._searcher = index.searcher()
+                        self._retire(old_searcher)
+                    else:
+                        # refresh() reuses the unchanged segments and closes the rest
+                        self._leases.pop(id(old_searcher), None)
+                        self._searcher = old_searcher.refresh()
+            searcher = self._searcher
+            self._leases[id(searcher)] = self._leases.get(id(searcher), 0) + 1
+            return searcher
+
+    def _release_searcher(self, searcher):
+        with self._lock:
+            self._leases[id(searcher)] -= 1
+            if searcher is not self._searcher:
+                self._retire(searcher)
+
+    def _retire(self, searcher):
+        if not self._leases.get(id(searcher)):
+            self._leases.pop(id(searcher), None)
+            searcher.close()
+
+    def sync_products(self, product_ids):
+        """Re-index the given products: existing ones are updated, missing ones deleted."""
+        product_ids = {int(product_id) for product_id in product_ids}
+        if not product_ids:
+            return 0
+        products = (
+            Product.query
+            .options(selectinload(Product.authors), selectinload(Product.categories))
+            .filter(Product.product_id.in_(product_ids))
+            .all()
+        )
+        deleted_ids = product_ids - {product.product_id for product in products}
 
-            products = Product.query.all()
+        writer = self.index.writer(timeout=self.writer_timeout)
+        try:
             for product in products:
-                authors = ", ".join([a.author_name for a in product.authors]) if product.authors else ''
-                categories = ", ".join([c.category_name for c in product.categories]) if product.categories else ''
-
-                writer.add_document(
-                    product_id=str(product.product_id),
-                    name=product.product_name,
-                    description=product.product_description or '',
-                    authors=authors,
-                    category=categories
-                )
-            writer.commit()
+                writer.update_document(**product_document(product))
+            for product_id in deleted_ids:
+                writer.delete_by_term('product_id', str(product_id))
+        except Exception:
+            writer.cancel()
+            raise
+        writer.commit()
+        self._stale = True
+        return len(product_ids)
 
-    def search(self, query_str, limit=100):
-        if not os.path.exists(self.index_dir):
-            self.create_index()
+    def _format(self, result):
+        return (
+            result['product_id'],
+            result['name'],
+            result.get('description', ''),
+            result.get('authors', ''),
+            result.get('category', '')
+        )
 
-        ix = open_dir(self.index_dir)
+    def search(self, query_str, limit=100):
         query_str = query_str.strip()
+        searcher = self._acquire_searcher()
+        try:
+            generation = searcher.reader().generation()
+            if self.cache is not None:
+                cached = self.cache.get(generation, query_str, 'search', limit)
+                if cached is not None:
+                    return [tuple(result) for result in cached]
 
-        with ix.searcher() as searcher:
-            parser = MultifieldParser(["name", "description", "authors", "category"], ix.schema)
-            query = parser.parse(query_str)
+            query = self._parser.parse(query_str)
             results = searcher.search(query, limit=limit)
+            search_results = [self._format(result) for result in results]
+        finally:
+            self._release_searcher(searcher)
+
+        if self.cache is not None:
+            self.cache.put(generation, query_str, 'search', limit, value=search_results)
+        return search_results
+
+    def search_page(self, query_str, page=1, per_page=24):
+        """One page of hits in rank order, with the total number of hits counted by Whoosh."""
+        query_str = query_str.strip()
+        offset = (max(page, 1) - 1) * per_page
+        searcher = self._acquire_searcher()
+        try:
+            generation = searcher.reader().generation()
+            if self.cache is not None:
+                cached = self.cache.get(generation, query_str, 'page', offset, per_page)
+                if cached is not None:
+                    return [tuple(result) for result in cached[0]], cached[1]
+
+            query = self._parser.parse(query_str)
+            # Only the hits up to the end of the requested page are scored and sorted
+            results = searcher.search(query, limit=offset + per_page)
+            total = len(results)
+            search_results = [self._format(result) for result in results[offset:offset + per_page]]
+        finally:
+            self._release_searcher(searcher)
+
+        if self.cache is not None:
+            self.cache.put(generation, query_str, 'page', offset, per_page, value=[search_results, total])
+        return search_results, total
+
+    def close(self):
+        with self._lock:
+            if self._searcher is not None:
+                self._searcher.close()
+                self._searcher = None
+
+
+def main(argv=None):
+    from flask import Flask
+    from config import Config
+    from db.dbo import db
+
+    parser = argparse.ArgumentParser(description="Build the Whoosh text index from the products table.")
+    parser.add_argument('--index-dir', default="indexdir")
+    parser.add_argument('--procs', type=int, default=1, help="Writer processes")
+    parser.add_argument('--limitmb', type=int, default=128, help="Memory limit per writer process (MB)")
+    parser.add_argument('--batch-size', type=int, default=1000, help="Products loaded per query batch")
+    parser.add_argument('--rebuild', action='store_true', help="Replace an existing index")
+    args = parser.parse_args(argv)
+
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    db.init_app(app)
+    with app.app_context():
+        TextSearch(args.index_dir).create_index(
+            rebuild=args.rebuild, procs=args.procs, limitmb=args.limitmb, batch_size=args.batch_size
+        )
+
 
-            search_results = []
-            for result in results:
-                search_results.append((
-                    result['product_id'],
-                    result['name'],
-                    result.get('description', ''),
-                    result.get('authors', ''),
-                    result.get('category', '')
-                ))
-
-        return search_results
\ No newline at end of file
+if __name__ == '__main__':
+    main()
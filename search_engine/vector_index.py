@@ -0,0 +1,198 @@
+import os
+import time
+import numpy as np
+import faiss
+
+# Compressed types store codes instead of float32 vectors: SQ8 uses 1 byte per dimension,
+# PQ uses pq_m bytes per vector (with 8-bit codes)
+COMPRESSED_INDEX_TYPES = ('sq8', 'pq', 'ivf_sq8', 'ivf_pq')
+INDEX_TYPES = ('flat', 'ivf', 'hnsw') + COMPRESSED_INDEX_TYPES
+PRETRANSFORMS = ('opq', 'pca')
+
+
+def index_path_for(vectors_file_path, index_type, tag=None):
+    # images.npy -> images.hnsw-m32_efc40.index, stored next to the vectors it was built from
+    base, _ = os.path.splitext(vectors_file_path)
+    if tag:
+        return f'{base}.{index_type}-{tag}.index'
+    return f'{base}.{index_type}.index'
+
+
+def build_params_from_config(index_config):
+    """build_index keyword arguments from a model.json index section (keys as in "images_index")."""
+    return {
+        'nlist': index_config.get('nlist'),
+        'hnsw_m': index_config.get('M', 32),
+        'ef_construction': index_config.get('efConstruction', 40),
+        'pq_m': index_config.get('pqM'),
+        'pq_nbits': index_config.get('pqBits', 8),
+        'pretransform': index_config.get('pretransform'),
+        'pca_dim': index_config.get('pcaDim'),
+    }
+
+
+def _default_nlist(n, nlist=None):
+    if nlist is None:
+        nlist = max(1, int(4 * np.sqrt(n)))
+    return min(nlist, n)
+
+
+def _default_pq_m(d):
+    # Largest usual sub-quantizer count that divides d, aiming at no more than d / 4 bytes per vector
+    for m in (64, 48, 32, 16, 8, 4, 2, 1):
+        if d % m == 0 and m <= max(1, d // 4):
+            return m
+    return 1
+
+
+def factory_string(index_type, d, n, nlist=None, pq_m=None, pq_nbits=8, pretransform=None, pca_dim=None):
+    """faiss.index_factory description of a compressed index, e.g. 'OPQ64,IVF1024,PQ64x8'."""
+    if index_type not in COMPRESSED_INDEX_TYPES:
+        raise ValueError(f"Not a compressed index type: {index_type}")
+    if pretransform not in (None,) + PRETRANSFORMS:
+        raise ValueError(f"Unknown pretransform: {pretransform}")
+
+    prefix = ''
+    if pretransform == 'pca':
+        d = pca_dim or d // 4
+        prefix = f'PCA{d},'
+    pq_m = pq_m or _default_pq_m(d)
+    if pretransform == 'opq':
+        prefix = f'OPQ{pq_m},'
+    # Each PQ sub-quantizer needs at least 2^nbits training vectors
+    pq_nbits = max(1, min(pq_nbits, int(np.log2(max(n, 2)))))
+
+    codes = 'SQ8' if index_type.endswith('sq8') else f'PQ{pq_m}x{pq_nbits}'
+    if index_type.startswith('ivf_'):
+        return f'{prefix}IVF{_default_nlist(n, nlist)},{codes}'
+    return f'{prefix}{codes}'
+
+
+def index_tag(index_type, d, n, **build_params):
+    """File name tag for the build parameters of an index, so changed settings never reuse an old file."""
+    if index_type == 'flat':
+        return None
+    if index_type == 'ivf':
+        return f'nlist{_default_nlist(n, build_params.get("nlist"))}'
+    if index_type == 'hnsw':
+        return f'm{build_params.get("hnsw_m") or 32}_efc{build_params.get("ef_construction") or 40}'
+    params = {key: build_params.get(key) for key in ('nlist', 'pq_m', 'pq_nbits', 'pretransform', 'pca_dim')
+              if build_params.get(key) is not None}
+    description = factory_string(index_type, d, n, **params)
+    return description.lower().replace(',', '_')
+
+
+def build_index(vectors, index_type='flat', nlist=None, hnsw_m=32, ef_construction=40,
+                pq_m=None, pq_nbits=8, pretransform=None, pca_dim=None, train_size=100000, seed=0):
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    n, d = vectors.shape
+
+    if index_type in COMPRESSED_INDEX_TYPES:
+        index = faiss.index_factory(
+            d, factory_string(index_type, d, n, nlist, pq_m, pq_nbits, pretransform, pca_dim), faiss.METRIC_L2
+        )
+        # Train on a sample, read in row order so memory-mapped vectors are scanned sequentially
+        if n > train_size:
+            sample = np.sort(np.random.default_rng(seed).choice(n, train_size, replace=False))
+            index.train(np.ascontiguousarray(vectors[sample]))
+        else:
+            index.train(vectors)
+    elif index_type == 'flat':
+        index = faiss.IndexFlatL2(d)
+    elif index_type == 'ivf':
+        nlist = _default_nlist(n, nlist)
+        quantizer = faiss.IndexFlatL2(d)
+        index = faiss.IndexIVFFlat(quantizer, d, nlist, faiss.METRIC_L2)
+        index.train(vectors)
+    elif index_type == 'hnsw':
+        index = faiss.IndexHNSWFlat(d, hnsw_m)
+        index.hnsw.efConstruction = ef_construction
+    else:
+        raise ValueError(f"Unknown index type: {index_type}")
+
+    index.add(vectors)
+    return index
+
+
+def set_search_params(index, nprobe=None, ef_search=None):
+    if nprobe is not None:
+        try:
+            faiss.extract_index_ivf(index).nprobe = nprobe
+        except RuntimeError:
+            pass  # Not an IVF index
+    if ef_search is not None and hasattr(index, 'hnsw'):
+        index.hnsw.efSearch = ef_search
+    return index
+
+
+def save_index(index, path):
+    # Write to a temporary file first so readers never see a half-written index
+    tmp_path = f'{path}.tmp'
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def load_index(path, mmap=True):
+    if mmap:
+        # Newer faiss releases can map flat codes too (IO_FLAG_MMAP_IFC); older ones only IVF lists
+        try:
+            return faiss.read_index(path, getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP))
+        except RuntimeError:
+            pass  # Index type that cannot be memory-mapped
+    return faiss.read_index(path)
+
+
+def index_memory_bytes(index):
+    """Size of the serialized index, which is close to its memory footprint once loaded."""
+    return int(faiss.serialize_index(index).size)
+
+
+def load_or_build_index(vectors, path, index_type='flat', rebuild=False, source_path=None, **build_params):
+    """Load a prebuilt index from `path`, or build it from `vectors` and save it there.
+
+    The saved index is reused as long as it holds as many vectors as `vectors`
+    and is not older than `source_path` (the file the vectors came from);
+    otherwise it is rebuilt.
+    """
+    if source_path and os.path.exists(path) and os.path.getmtime(source_path) > os.path.getmtime(path):
+        rebuild = True
+    if not rebuild and os.path.exists(path):
+        index = load_index(path)
+        if index.ntotal == len(vectors):
+            return index, False
+
+    index = build_index(vectors, index_type, **build_params)
+    save_index(index, path)
+    return index, True
+
+
+def evaluate_recall(index, vectors, k=10, n_queries=100, seed=0):
+    """Measure recall@k of `index` against an exact IndexFlatL2 over the same vectors.
+
+    Queries are sampled from the catalog itself. Returns a dict with the recall
+    and the mean query latency of both indexes in milliseconds.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    rng = np.random.default_rng(seed)
+    n_queries = min(n_queries, len(vectors))
+    queries = vectors[rng.choice(len(vectors), n_queries, replace=False)]
+
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+
+    start = time.perf_counter()
+    _, expected = exact.search(queries, k)
+    exact_ms = (time.perf_counter() - start) * 1000 / n_queries
+
+    start = time.perf_counter()
+    _, found = index.search(queries, k)
+    index_ms = (time.perf_counter() - start) * 1000 / n_queries
+
+    hits = sum(len(np.intersect1d(e[e >= 0], f[f >= 0])) for e, f in zip(expected, found))
+    return {
+        'k': k,
+        'queries': n_queries,
+        'recall': hits / float(expected.size),
+        'latency_ms': index_ms,
+        'exact_latency_ms': exact_ms,
+    }
@@ -0,0 +1,234 @@
+import bisect
+import threading
+import time
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Seconds; Prometheus buckets are upper bounds, the last implicit bucket is +Inf
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def render(self, name, labels):
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f'{name}_bucket{_labels(labels, le=le)} {cumulative}')
+        lines.append(f'{name}_sum{_labels(labels)} {total}')
+        lines.append(f'{name}_count{_labels(labels)} {count}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, **extra):
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in items) + '}'
+
+
+class _Trace:
+    __slots__ = ('route', 'method', 'start', 'spans', 'depth', 'queries', 'status')
+
+    def __init__(self, route, method):
+        self.route = route
+        self.method = method
+        self.start = time.perf_counter()
+        self.spans = []
+        self.depth = 0
+        self.queries = 0
+        self.status = None
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'trace', 'start')
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        trace = self.trace = getattr(self.tracer._local, 'trace', None)
+        if trace is not None:
+            trace.depth += 1
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        duration = time.perf_counter() - self.start
+        trace = self.trace
+        if trace is not None:
+            trace.depth -= 1
+            trace.spans.append((self.start, trace.depth, self.name, duration))
+        self.tracer._observe_span(self.name, duration)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """Timed spans per request, per-route latency and DB query histograms, exported as Prometheus text.
+
+    `span(name)` is a context manager; spans opened while another is open nest under it.
+    Requests slower than `slow_request_ms` are printed with their span breakdown.
+    """
+
+    def __init__(self, enabled=True, slow_request_ms=None):
+        self.enabled = enabled
+        self.slow_request_ms = slow_request_ms
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._request_seconds = {}
+        self._request_queries = {}
+        self._span_seconds = {}
+        self._requests_total = {}
+        self._collectors = []
+
+    def init_app(self, app):
+        if not self.enabled:
+            return
+        app.before_request(self._start_request)
+        app.after_request(self._record_status)
+        app.teardown_request(self._finish_request)
+        event.listen(Engine, 'before_cursor_execute', self._count_query)
+
+    def span(self, name):
+        if not self.enabled:
+            return _NOOP_SPAN
+        return _Span(self, name)
+
+    def register_metric(self, name, metric_type, help_text, collect, label=None):
+        """
+        A metric read at scrape time: `collect()` returns a number, or a {label value: number} dict
+        when `label` is given. None skips the metric.
+        """
+        self._collectors.append((name, metric_type, help_text, collect, label))
+
+    def _histogram(self, histograms, key, buckets):
+        histogram = histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = histograms.setdefault(key, Histogram(buckets))
+        return histogram
+
+    def _observe_span(self, name, duration):
+        self._histogram(self._span_seconds, name, LATENCY_BUCKETS).observe(duration)
+
+    def _count_query(self, *args):
+        trace = getattr(self._local, 'trace', None)
+        if trace is not None:
+            trace.queries += 1
+
+    def _start_request(self):
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        self._local.trace = _Trace(route, request.method)
+
+    def _record_status(self, response):
+        trace = getattr(self._local, 'trace', None)
+        if trace is not None:
+            trace.status = response.status_code
+        return response
+
+    def _finish_request(self, exc=None):
+        trace = getattr(self._local, 'trace', None)
+        if trace is None:
+            return
+        self._local.trace = None
+        duration = time.perf_counter() - trace.start
+        status = trace.status or 500
+        key = (trace.method, trace.route)
+
+        self._histogram(self._request_seconds, key, LATENCY_BUCKETS).observe(duration)
+        self._histogram(self._request_queries, key, QUERY_COUNT_BUCKETS).observe(trace.queries)
+        with self._lock:
+            self._requests_total[key + (status,)] = self._requests_total.get(key + (status,), 0) + 1
+
+        if self.slow_request_ms is not None and duration * 1000 >= self.slow_request_ms:
+            print(self.format_trace(trace, duration, status))
+
+    def format_trace(self, trace, duration, status):
+        lines = [
+            f"Slow request {trace.method} {trace.route} {status}: "
+            f"{duration * 1000:.1f} ms, {trace.queries} DB queries"
+        ]
+        for start, depth, name, span_duration in sorted(trace.spans):
+            lines.append(f"{'  ' * (depth + 1)}{name} {span_duration * 1000:.1f} ms "
+                         f"(+{(start - trace.start) * 1000:.1f} ms)")
+        return '\n'.join(lines)
+
+    def render_metrics(self):
+        lines = [
+            '# HELP http_request_duration_seconds Request latency by route.',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        for (method, route), histogram in sorted(self._request_seconds.items()):
+            lines += histogram.render('http_request_duration_seconds', [('method', method), ('route', route)])
+
+        lines += [
+            '# HELP http_requests_total Requests by route and status.',
+            '# TYPE http_requests_total counter',
+        ]
+        for (method, route, status), count in sorted(self._requests_total.items()):
+            lines.append(f'http_requests_total{_labels([("method", method), ("route", route), ("status", status)])} {count}')
+
+        lines += [
+            '# HELP db_queries_per_request Database queries executed per request by route.',
+            '# TYPE db_queries_per_request histogram',
+        ]
+        for (method, route), histogram in sorted(self._request_queries.items()):
+            lines += histogram.render('db_queries_per_request', [('method', method), ('route', route)])
+
+        lines += [
+            '# HELP span_duration_seconds Latency of traced stages and engine calls.',
+            '# TYPE span_duration_seconds histogram',
+        ]
+        for name, histogram in sorted(self._span_seconds.items()):
+            lines += histogram.render('span_duration_seconds', [('span', name)])
+
+        for name, metric_type, help_text, collect, label in self._collectors:
+            value = collect()
+            if value is None:
+                continue
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {metric_type}']
+            if label is None:
+                lines.append(f'{name} {value}')
+            else:
+                for label_value, item in value.items():
+                    lines.append(f'{name}{_labels([(label, label_value)])} {item}')
+        return '\n'.join(lines) + '\n'